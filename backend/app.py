@@ -1,4 +1,4 @@
-# app.py — Windows-friendly Helm discovery (no Scapy L2 ARP sweep)
+# app.py — Helm discovery for Windows/Linux/macOS (no Scapy L2 ARP sweep)
 #
 # + SIMPLE USER MANAGEMENT (NOT SECURE BY DESIGN)
 #   - First-run setup creates admin
@@ -20,15 +20,27 @@
 #
 # Existing endpoints (now filtered by user permissions):
 #   GET /api/devices
+#   GET /api/devices/stream        (SSE: snapshot + per-printer deltas)
 #   GET /api/history/aggregate
+#   GET /api/history/query         (time-range / day|week|month / group_by printer|file)
 #
 # NEW (UI heartbeat):
 #   GET /api/health
 #
 # ✅ NEW (fleet file list):
 #   GET /api/gcodes                (unique gcode file paths across allowed printers)
-
-from flask import Flask, jsonify, request, send_from_directory, make_response, abort
+#   GET /api/gcodes/locations      (?file=... -> which allowed printers have it)
+#   GET /api/thumbnails/<hostname>/<file>  (cached thumbnail proxy)
+#
+# ✅ NEW (fleet commands):
+#   POST /api/commands             (fan a command out to allowed printers; JSON or SSE results)
+#   GET  /api/commands             (recent command log)
+#   POST /api/uploads              (upload once, distribute to printers; progress per printer)
+#   GET  /api/uploads/<id>
+#   POST /api/uploads/<id>/retry   (re-send to failed targets)
+
+from flask import Flask, jsonify, request, send_from_directory, make_response, abort, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
 import json
@@ -42,19 +54,72 @@ import socket
 import ipaddress
 import time
 import copy
+import random
+from types import MappingProxyType
+import asyncio
+import sqlite3
+import mmap
+import hashlib
+import gzip
+import bisect
+from array import array
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
-from typing import List, Tuple, Optional, Dict, Any, Callable
+from collections import deque, OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Tuple, Optional, Dict, Any, Callable, Mapping
 from functools import wraps
 
+try:
+    import websocket  # websocket-client; without it live status falls back to HTTP polling
+except ImportError:
+    websocket = None
+
+try:
+    from waitress import serve as waitress_serve  # optional: production WSGI server
+except ImportError:
+    waitress_serve = None
+
+try:
+    from zeroconf import Zeroconf, ServiceBrowser  # optional: mDNS printer discovery
+except ImportError:
+    Zeroconf = None
+    ServiceBrowser = None
+
+try:
+    import numpy as np  # optional: vectorized history analytics (pure-Python fallback otherwise)
+except ImportError:
+    np = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _env_number(name: str, default: Any, cast: Callable[[str], Any] = int) -> Any:
+    """Numeric HELM_* setting; a malformed value logs a warning and keeps the default."""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        logger.warning("Ignoring %s=%r (not a valid %s); using %s", name, raw, cast.__name__, default)
+        return default
+
 # Serve the built Vue app from project-root /dist
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # project root (parent of /backend)
 
 app = Flask(__name__, static_folder="static/assets", static_url_path="/assets")
 
+def _json_default(o: Any) -> Any:
+    # Cached device snapshots are read-only mappings
+    if isinstance(o, MappingProxyType):
+        return dict(o)
+    return DefaultJSONProvider.default(o)
+
+class HelmJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_json_default)
+
+app.json = HelmJSONProvider(app)
+
 # If you want cookie-based auth from a different origin, keep supports_credentials True
 CORS(app, supports_credentials=True)
 
@@ -73,6 +138,11 @@ _APP_DIR = os.path.dirname(_sys.executable) if getattr(_sys, "frozen", False) el
 
 DATA_DIR = os.path.join(_APP_DIR, "data")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
+PRINTERS_FILE = os.path.join(DATA_DIR, "printers.json")
+HISTORY_DB_FILE = os.path.join(DATA_DIR, "history.sqlite3")
+UPLOAD_SPOOL_DIR = os.path.join(DATA_DIR, "uploads")
+GCODE_STORE_DIR = os.path.join(DATA_DIR, "gcode_store")
+THUMB_CACHE_DIR = os.path.join(DATA_DIR, "thumb_cache")
 
 # ---------------------------
 # ✅ Right-rail persistence (per-user)
@@ -163,6 +233,12 @@ def _write_right_rail_for_user(user_id: str, doc: Dict[str, Any]) -> None:
 
 users_file_lock = threading.Lock()
 
+# Parsed users.json plus lookup indexes, so auth checks are dict lookups.
+# Refreshed on save_users_doc, or when the file changes on disk (checked at
+# most every USERS_STAT_INTERVAL_S).
+USERS_STAT_INTERVAL_S = 1.0
+users_cache: Dict[str, Any] = {"path": None, "stat": None, "checked_ts": 0.0}
+
 # In-memory session store: token -> user_id
 # (Not persisted; restart requires re-login)
 sessions_lock = threading.Lock()
@@ -181,16 +257,24 @@ HEALTH_SNAPSHOT: Dict[str, Any] = {
     "last_printers_found": 0,
     "last_discovery_ms": None,
     "last_error": None,
+    "last_status_refresh_ms": None,
+    "registry_size": 0,
 }
 
 DISCOVERY_CACHE_TTL_S = 5.0
 DEVICES_CACHE_TTL_S = 0.25
-DISCOVERY_MAX_WORKERS = 48
 WARM_SWEEP_WORKERS = 24
 WARM_SWEEP_COOLDOWN_S = 30.0
 
-discovery_cache_lock = threading.Lock()
-discovery_cache: Dict[Tuple[str, Tuple[int, ...], bool], Dict[str, Any]] = {}
+# How long past its TTL a snapshot may still be served while a refresh runs
+DISCOVERY_STALE_S = 60.0
+DEVICES_STALE_S = 5.0
+
+snapshot_cache_lock = threading.Lock()
+# key -> {"ts": float, "value": Any}
+snapshot_cache: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+# key -> {"event": threading.Event, "error": Optional[Exception]}
+snapshot_inflight: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
 
 warm_sweep_lock = threading.Lock()
 last_warm_sweep_ts: Dict[str, float] = {}
@@ -201,19 +285,70 @@ def ensure_data_dir() -> None:
 def _default_users_doc() -> Dict[str, Any]:
     return {"users": []}
 
-def load_users_doc() -> Dict[str, Any]:
-    ensure_data_dir()
-    with users_file_lock:
-        if not os.path.isfile(USERS_FILE):
-            return _default_users_doc()
-        try:
-            with open(USERS_FILE, "r", encoding="utf-8") as f:
-                doc = json.load(f)
-            if not isinstance(doc, dict) or "users" not in doc or not isinstance(doc["users"], list):
-                return _default_users_doc()
-            return doc
-        except Exception:
+def _read_users_file() -> Dict[str, Any]:
+    if not os.path.isfile(USERS_FILE):
+        return _default_users_doc()
+    try:
+        with open(USERS_FILE, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+        if not isinstance(doc, dict) or "users" not in doc or not isinstance(doc["users"], list):
             return _default_users_doc()
+        return doc
+    except Exception:
+        return _default_users_doc()
+
+def _users_file_stat() -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(USERS_FILE)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _index_users_locked(doc: Dict[str, Any], stat: Optional[Tuple[int, int]]) -> None:
+    by_id: Dict[str, Dict[str, Any]] = {}
+    by_pin: Dict[str, Dict[str, Any]] = {}
+    admins_by_username: Dict[str, Dict[str, Any]] = {}
+    allowed: Dict[int, Tuple[Dict[str, Any], Optional[frozenset]]] = {}
+    admin = None
+    for u in doc.get("users", []):
+        if not isinstance(u, dict):
+            continue
+        by_id.setdefault(u.get("id"), u)
+        allowed[id(u)] = (u, _compile_allowed_printers(u))
+        if u.get("role") == "admin":
+            admin = admin or u
+            admins_by_username.setdefault(str(u.get("username", "")).lower(), u)
+        elif u.get("role") == "user":
+            by_pin.setdefault(str(u.get("pin", "")), u)
+    users_cache.update(
+        path=USERS_FILE,
+        stat=stat,
+        checked_ts=time.time(),
+        doc=doc,
+        by_id=by_id,
+        by_pin=by_pin,
+        admins_by_username=admins_by_username,
+        admin=admin,
+        allowed=allowed,
+    )
+
+def _users_index() -> Dict[str, Any]:
+    """Indexed view of users.json; entries are shared and must not be mutated."""
+    with users_file_lock:
+        now = time.time()
+        if users_cache["path"] == USERS_FILE and now - users_cache["checked_ts"] < USERS_STAT_INTERVAL_S:
+            return users_cache
+        stat = _users_file_stat()
+        if users_cache["path"] != USERS_FILE or stat != users_cache["stat"]:
+            ensure_data_dir()
+            _index_users_locked(_read_users_file(), stat)
+        else:
+            users_cache["checked_ts"] = now
+        return users_cache
+
+def load_users_doc() -> Dict[str, Any]:
+    """Private copy of the users document, for callers that edit and save it."""
+    return copy.deepcopy(_users_index()["doc"])
 
 def save_users_doc(doc: Dict[str, Any]) -> None:
     ensure_data_dir()
@@ -222,41 +357,22 @@ def save_users_doc(doc: Dict[str, Any]) -> None:
         with open(tmp, "w", encoding="utf-8") as f:
             json.dump(doc, f, indent=2)
         os.replace(tmp, USERS_FILE)
+        _index_users_locked(copy.deepcopy(doc), _users_file_stat())
 
 def is_configured() -> bool:
-    doc = load_users_doc()
-    for u in doc.get("users", []):
-        if u.get("role") == "admin":
-            return True
-    return False
+    return _users_index()["admin"] is not None
 
 def find_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
-    doc = load_users_doc()
-    for u in doc.get("users", []):
-        if u.get("id") == user_id:
-            return u
-    return None
+    return _users_index()["by_id"].get(user_id)
 
 def find_admin() -> Optional[Dict[str, Any]]:
-    doc = load_users_doc()
-    for u in doc.get("users", []):
-        if u.get("role") == "admin":
-            return u
-    return None
+    return _users_index()["admin"]
 
 def find_user_by_pin(pin: str) -> Optional[Dict[str, Any]]:
-    doc = load_users_doc()
-    for u in doc.get("users", []):
-        if u.get("role") == "user" and str(u.get("pin", "")) == str(pin):
-            return u
-    return None
+    return _users_index()["by_pin"].get(str(pin))
 
 def find_admin_by_username(username: str) -> Optional[Dict[str, Any]]:
-    doc = load_users_doc()
-    for u in doc.get("users", []):
-        if u.get("role") == "admin" and str(u.get("username", "")).lower() == str(username).lower():
-            return u
-    return None
+    return _users_index()["admins_by_username"].get(str(username).lower())
 
 def create_session(user_id: str) -> str:
     token = secrets.token_urlsafe(24)
@@ -268,6 +384,8 @@ def clear_session(token: str) -> None:
     with sessions_lock:
         sessions.pop(token, None)
 
+QUERY_TOKEN_PATHS = frozenset({"/api/devices/stream"})
+
 def get_token_from_request() -> Optional[str]:
     # Prefer Authorization header
     auth = request.headers.get("Authorization", "")
@@ -275,7 +393,13 @@ def get_token_from_request() -> Optional[str]:
         return auth.split(" ", 1)[1].strip() or None
     # Fallback to cookie
     tok = request.cookies.get("helm_session")
-    return tok or None
+    if tok:
+        return tok
+    # EventSource can't set headers; allow ?token= for the stream endpoint only,
+    # so tokens don't end up in URLs and access logs for the rest of the API
+    if request.path in QUERY_TOKEN_PATHS:
+        return request.args.get("token") or None
+    return None
 
 def current_user() -> Optional[Dict[str, Any]]:
     tok = get_token_from_request()
@@ -315,20 +439,35 @@ def require_admin(fn: Callable):
         return fn(*args, **kwargs)
     return wrapper
 
-def allowed_printer_hostnames_for_user(u: Dict[str, Any]) -> Optional[set]:
+def _compile_allowed_printers(u: Dict[str, Any]) -> Optional[frozenset]:
+    if u.get("role") == "admin":
+        return None
+    printers = u.get("printers") or []
+    if "*" in printers:
+        return None
+    return frozenset(str(x) for x in printers if x)
+
+def allowed_printer_hostnames_for_user(u: Dict[str, Any]) -> Optional[frozenset]:
     """
     Returns:
       - None for admin / wildcard (means all)
       - set of allowed hostnames for regular users
+    Users from the user store get the set compiled when it was indexed.
     """
     if not u:
-        return set()
-    if u.get("role") == "admin":
-        return None
-    printers = u.get("printers") or []
-    if "*" in printers:
-        return None
-    return set(str(x) for x in printers if x)
+        return frozenset()
+    hit = users_cache.get("allowed", {}).get(id(u))
+    if hit is not None and hit[0] is u:
+        return hit[1]
+    return _compile_allowed_printers(u)
+
+# Filtered device views, memoized per (snapshot, permission set). Snapshots are
+# immutable tuples shared between requests, so each distinct permission set is
+# filtered once per refresh instead of once per request.
+DEVICE_VIEW_SNAPSHOTS = 8
+device_views_lock = threading.Lock()
+# id(snapshot) -> (snapshot, {allowed set: filtered view})
+device_views: "OrderedDict[int, Tuple[Any, Dict[frozenset, Tuple[Mapping[str, Any], ...]]]]" = OrderedDict()
 
 def filter_devices_for_user(devices: List[Dict[str, Any]], u: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
     # If not logged in, show nothing (your UI will route to login anyway)
@@ -337,12 +476,109 @@ def filter_devices_for_user(devices: List[Dict[str, Any]], u: Optional[Dict[str,
     allowed = allowed_printer_hostnames_for_user(u)
     if allowed is None:
         return devices
-    out = []
-    for d in devices:
-        hn = str(d.get("hostname") or "")
-        if hn in allowed:
-            out.append(d)
-    return out
+    if not isinstance(devices, tuple):
+        return [d for d in devices if str(d.get("hostname") or "") in allowed]
+
+    with device_views_lock:
+        entry = device_views.get(id(devices))
+        if entry is not None and entry[0] is devices:
+            view = entry[1].get(allowed)
+            if view is not None:
+                return view
+    view = tuple(d for d in devices if str(d.get("hostname") or "") in allowed)
+    with device_views_lock:
+        entry = device_views.get(id(devices))
+        if entry is None or entry[0] is not devices:
+            entry = (devices, {})
+            device_views[id(devices)] = entry
+        device_views.move_to_end(id(devices))
+        entry[1][allowed] = view
+        while len(device_views) > DEVICE_VIEW_SNAPSHOTS:
+            device_views.popitem(last=False)
+    return view
+
+# ---------------------------
+# ✅ Snapshot cache (stale-while-revalidate + single-flight)
+# ---------------------------
+
+def freeze_devices(devices: List[Dict[str, Any]]) -> Tuple[Mapping[str, Any], ...]:
+    """
+    Read-only view of a device list, safe to hand to many requests without copying.
+    """
+    return tuple(MappingProxyType(dict(d)) for d in devices)
+
+def _run_snapshot_flight(key: Tuple[Any, ...], flight: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+    value = None
+    try:
+        value = compute()
+        with snapshot_cache_lock:
+            snapshot_cache[key] = {"ts": time.time(), "value": value}
+    except Exception as e:
+        flight["error"] = e
+    finally:
+        with snapshot_cache_lock:
+            snapshot_inflight.pop(key, None)
+        flight["event"].set()
+    if flight["error"] is not None:
+        raise flight["error"]
+    return value
+
+def _refresh_in_background(key: Tuple[Any, ...], compute: Callable[[], Any]) -> None:
+    with snapshot_cache_lock:
+        if key in snapshot_inflight:
+            return
+        flight = {"event": threading.Event(), "error": None}
+        snapshot_inflight[key] = flight
+
+    def run():
+        try:
+            _run_snapshot_flight(key, flight, compute)
+        except Exception as e:
+            logger.info("Background refresh for %s failed: %s", key[0], e)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def cached_snapshot(
+    key: Tuple[Any, ...],
+    ttl_s: float,
+    stale_s: float,
+    compute: Callable[[], Any],
+    force: bool = False,
+) -> Any:
+    """
+    - fresh (age <= ttl_s): return the cached value
+    - stale (age <= ttl_s + stale_s): return it anyway, refresh in the background
+    - missing / expired / force: compute now; concurrent callers for the same
+      key wait on that one computation instead of starting their own
+    """
+    now = time.time()
+    with snapshot_cache_lock:
+        cached = snapshot_cache.get(key)
+        usable = cached is not None and not force and ttl_s > 0
+        age = now - float(cached["ts"]) if cached else 0.0
+        if usable and age <= ttl_s:
+            return cached["value"]
+        serve_stale = usable and age <= ttl_s + stale_s
+
+        if not serve_stale:
+            flight = snapshot_inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = {"event": threading.Event(), "error": None}
+                snapshot_inflight[key] = flight
+
+    if serve_stale:
+        _refresh_in_background(key, compute)
+        return cached["value"]
+
+    if owner:
+        return _run_snapshot_flight(key, flight, compute)
+
+    flight["event"].wait()
+    if flight["error"] is not None:
+        raise flight["error"]
+    with snapshot_cache_lock:
+        return snapshot_cache[key]["value"]
 
 # ---------------------------
 # Helpers: local IP, ARP table
@@ -362,7 +598,7 @@ def get_my_ipv4() -> str:
 
 def ping_once(ip: str, timeout_ms: int = 150) -> None:
     """
-    Single ping used to warm Windows neighbor/ARP cache.
+    Single ping used to warm Windows neighbor/ARP cache (Windows flags).
     """
     try:
         subprocess.run(
@@ -389,9 +625,33 @@ def should_run_warm_sweep(cidr: str) -> bool:
         last_warm_sweep_ts[cidr] = now
         return True
 
+def udp_neighbor_sweep(hosts: List[str], settle_s: float = 0.5) -> None:
+    """
+    Populate the kernel neighbor table from one UDP socket: sending a datagram
+    to each host makes the OS ARP-resolve it, without a process per host.
+    Port 9 (discard) so anything that does answer ignores it.
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setblocking(False)
+        for ip in hosts:
+            for _ in range(3):
+                try:
+                    s.sendto(b"", (ip, 9))
+                    break
+                except (BlockingIOError, InterruptedError):
+                    time.sleep(0.005)  # send buffer full (ENOBUFS/EAGAIN): back off briefly
+                except OSError:
+                    break  # unreachable etc.; the ARP request still went out
+    finally:
+        s.close()
+    # Give ARP replies a moment to land before the table is read
+    time.sleep(settle_s)
+
 def warm_neighbor_table(cidr: str, limit: Optional[int] = None) -> None:
     """
-    Ping-sweep (bounded concurrency) to populate arp -a.
+    Populate the neighbor/ARP table before reading it.
+    Windows: ping-sweep (bounded concurrency). Elsewhere: one UDP sweep.
     Limit can reduce load.
     """
     net = ipaddress.ip_network(cidr, strict=False)
@@ -402,6 +662,10 @@ def warm_neighbor_table(cidr: str, limit: Optional[int] = None) -> None:
     if not hosts:
         return
 
+    if not _sys.platform.startswith("win"):
+        udp_neighbor_sweep(hosts)
+        return
+
     workers = min(WARM_SWEEP_WORKERS, len(hosts))
     with ThreadPoolExecutor(max_workers=workers) as pool:
         futures = [pool.submit(ping_once, ip) for ip in hosts]
@@ -411,9 +675,27 @@ def warm_neighbor_table(cidr: str, limit: Optional[int] = None) -> None:
             except Exception:
                 pass
 
+def _is_unicast_neighbor(ip: str, mac: str) -> bool:
+    """
+    Filter multicast / broadcast-ish entries (mac in dashed lowercase form).
+    """
+    if ip.startswith("224.") or ip.startswith("239.") or ip.endswith(".255") or ip == "255.255.255.255":
+        return False
+    # Filter common multicast MAC prefixes
+    if mac.startswith("01-00-5e") or mac == "ff-ff-ff-ff-ff-ff" or mac == "00-00-00-00-00-00":
+        return False
+    return True
+
+def _normalize_mac(mac: str) -> str:
+    """
+    aa:bb:c:dd:ee:ff / AA-BB-... -> aa-bb-0c-dd-ee-ff (the format arp -a uses on Windows).
+    """
+    parts = re.split(r"[:-]", mac.strip().lower())
+    return "-".join(p.zfill(2) for p in parts)
+
 def parse_arp_a() -> List[Tuple[str, str]]:
     """
-    Parse `arp -a` output into (ip, mac).
+    Parse Windows `arp -a` output into (ip, mac).
     Only includes entries that look like real unicast neighbors.
     """
     out = subprocess.check_output(["arp", "-a"], text=True, encoding="utf-8", errors="ignore")
@@ -427,20 +709,63 @@ def parse_arp_a() -> List[Tuple[str, str]]:
         if not m:
             continue
 
-        ip, mac, typ = m.group(1), m.group(2).lower(), m.group(3).lower()
-
-        # Filter multicast / broadcast-ish entries
-        if ip.startswith("224.") or ip.startswith("239.") or ip.endswith(".255") or ip == "255.255.255.255":
-            continue
+        ip, mac = m.group(1), m.group(2).lower()
+        if _is_unicast_neighbor(ip, mac):
+            entries.append((ip, mac))
 
-        # Filter common multicast MAC prefixes
-        if mac.startswith("01-00-5e") or mac == "ff-ff-ff-ff-ff-ff":
-            continue
+    return entries
 
-        entries.append((ip, mac))
+def read_proc_net_arp(path: str = "/proc/net/arp") -> List[Tuple[str, str]]:
+    """
+    Linux: read the kernel neighbor table directly (no subprocess).
+      IP address  HW type  Flags  HW address         Mask  Device
+      192.168.1.5 0x1      0x2    d8:3a:dd:e0:c9:4b  *     eth0
+    Flags 0x0 means the entry is incomplete (no reply yet).
+    """
+    entries: List[Tuple[str, str]] = []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        next(f, None)  # header
+        for line in f:
+            cols = line.split()
+            if len(cols) < 4:
+                continue
+            ip, flags, mac = cols[0], cols[2], _normalize_mac(cols[3])
+            try:
+                if int(flags, 16) == 0:
+                    continue
+            except ValueError:
+                continue
+            if _is_unicast_neighbor(ip, mac):
+                entries.append((ip, mac))
+    return entries
 
+def parse_arp_an() -> List[Tuple[str, str]]:
+    """
+    macOS / BSD: parse `arp -an` ("? (192.168.1.5) at d8:3a:dd:e0:c9:4b on en0 ...").
+    """
+    out = subprocess.check_output(["arp", "-an"], text=True, encoding="utf-8", errors="ignore")
+    line_re = re.compile(r"\((\d{1,3}(?:\.\d{1,3}){3})\)\s+at\s+([0-9a-fA-F:]+)\s")
+    entries: List[Tuple[str, str]] = []
+    for line in out.splitlines():
+        m = line_re.search(line)
+        if not m:
+            continue
+        ip, mac = m.group(1), _normalize_mac(m.group(2))
+        if _is_unicast_neighbor(ip, mac):
+            entries.append((ip, mac))
     return entries
 
+def read_neighbor_table() -> List[Tuple[str, str]]:
+    """
+    (ip, mac) neighbors for this platform. Linux reads /proc/net/arp,
+    Windows parses `arp -a`, macOS/BSD parse `arp -an`.
+    """
+    if _sys.platform.startswith("linux") and os.path.isfile("/proc/net/arp"):
+        return read_proc_net_arp()
+    if _sys.platform.startswith("win"):
+        return parse_arp_a()
+    return parse_arp_an()
+
 def port_open(ip: str, port: int, timeout: float = 0.25) -> bool:
     """
     Fast TCP connect test.
@@ -451,6 +776,74 @@ def port_open(ip: str, port: int, timeout: float = 0.25) -> bool:
     except OSError:
         return False
 
+# ---------------------------
+# ✅ Moonraker HTTP client (shared keep-alive pool)
+# ---------------------------
+#
+# All Moonraker traffic goes through one Session so connections to each
+# printer are reused instead of paying a TCP handshake per request.
+# Tunable via environment variables for large fleets / slow networks.
+
+MOONRAKER_POOL_HOSTS = _env_number("HELM_MOONRAKER_POOL_HOSTS", 256)
+MOONRAKER_POOL_PER_HOST = _env_number("HELM_MOONRAKER_POOL_PER_HOST", 8)
+MOONRAKER_CONNECT_TIMEOUT_S = _env_number("HELM_MOONRAKER_CONNECT_TIMEOUT_S", 1.0, float)
+MOONRAKER_READ_TIMEOUT_S = _env_number("HELM_MOONRAKER_READ_TIMEOUT_S", 2.0, float)
+
+moonraker_session = requests.Session()
+_moonraker_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=MOONRAKER_POOL_HOSTS,
+    pool_maxsize=MOONRAKER_POOL_PER_HOST,
+    max_retries=0,
+)
+moonraker_session.mount("http://", _moonraker_adapter)
+moonraker_session.mount("https://", _moonraker_adapter)
+
+moonraker_stats_lock = threading.Lock()
+moonraker_stats: Dict[str, int] = {"requests": 0, "errors": 0}
+
+def moonraker_request(method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+    """
+    Pooled request to a printer. `timeout` is the read timeout (defaults to
+    MOONRAKER_READ_TIMEOUT_S); the connect timeout is MOONRAKER_CONNECT_TIMEOUT_S.
+    Raises requests.RequestException like requests.get would.
+    """
+    read_timeout = MOONRAKER_READ_TIMEOUT_S if timeout is None else float(timeout)
+    connect_timeout = min(MOONRAKER_CONNECT_TIMEOUT_S, read_timeout)
+    with moonraker_stats_lock:
+        moonraker_stats["requests"] += 1
+    try:
+        return moonraker_session.request(method, url, timeout=(connect_timeout, read_timeout), **kwargs)
+    except requests.RequestException:
+        with moonraker_stats_lock:
+            moonraker_stats["errors"] += 1
+        raise
+
+def moonraker_get(url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+    return moonraker_request("GET", url, timeout=timeout, **kwargs)
+
+def moonraker_pool_stats() -> Dict[str, Any]:
+    """
+    Counters for /api/health: requests sent, TCP connections opened, and how
+    many requests rode an already-open connection.
+    """
+    opened = 0
+    served = 0
+    pools = _moonraker_adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        opened += int(getattr(pool, "num_connections", 0))
+        served += int(getattr(pool, "num_requests", 0))
+    with moonraker_stats_lock:
+        out = dict(moonraker_stats)
+    out.update({
+        "host_pools": len(pools),
+        "connections_opened": opened,
+        "connections_reused": max(0, served - opened),
+    })
+    return out
+
 # ---------------------------
 # Moonraker probing + queries
 # ---------------------------
@@ -464,7 +857,7 @@ def pick_moonraker_base(ip: str, ports: List[int]) -> Optional[str]:
         base = f"http://{ip}:{p}"
         info_url = f"{base}/printer/info"
         try:
-            r = requests.get(info_url, timeout=1.5)
+            r = moonraker_get(info_url, timeout=1.5)
             r.raise_for_status()
             j = r.json()
             if isinstance(j, dict) and "result" in j:
@@ -475,138 +868,323 @@ def pick_moonraker_base(ip: str, ports: List[int]) -> Optional[str]:
             continue
     return None
 
+PRINTER_INFO_CACHE_TTL_S = 300.0
+
+# Every Klipper object/field the dashboard shows. Used both for the batched
+# HTTP objects query and for the websocket subscription.
+# Objects a printer doesn't have (e.g. extruder2) are simply absent from the reply.
+STATUS_OBJECT_FIELDS: Dict[str, List[str]] = {
+    "webhooks": ["state", "state_message"],
+    "idle_timeout": ["state"],
+    "virtual_sdcard": ["progress", "file_path"],
+    "extruder": ["target", "temperature"],
+    "extruder1": ["target", "temperature"],
+    "extruder2": ["target", "temperature"],
+    "heater_bed": ["target", "temperature"],
+}
+
+# One objects query for everything the dashboard shows (was six separate GETs).
+STATUS_QUERY_OBJECTS = "&".join(f"{obj}={','.join(fields)}" for obj, fields in STATUS_OBJECT_FIELDS.items())
+
+printer_info_cache_lock = threading.Lock()
+# base_url -> {"ts", "hostname", "software_version", "helm_version"}
+printer_info_cache: Dict[str, Dict[str, Any]] = {}
+
+def fetch_helm_version(base: str) -> Optional[str]:
+    """
+    Helm theme version from the printer's custom CSS (None = legacy / no theme).
+    """
+    try:
+        css_url = f"{base}/server/files/config/.theme/custom.css"
+        r_css = moonraker_get(css_url)
+        if r_css.ok:
+            m = re.search(r'content:\s*["\'][^"\']*?v([\d][^\s"\']+)', r_css.text)
+            if m:
+                return m.group(1)
+    except requests.RequestException:
+        pass
+    return None
+
+def get_printer_static_info(base: str) -> Dict[str, Any]:
+    """
+    /printer/info + theme version, cached per base URL. These rarely change so
+    they are only re-fetched every PRINTER_INFO_CACHE_TTL_S.
+    Raises requests.RequestException / KeyError like a direct fetch would.
+    """
+    with printer_info_cache_lock:
+        cached = printer_info_cache.get(base)
+        if cached and (time.time() - float(cached.get("ts", 0.0)) <= PRINTER_INFO_CACHE_TTL_S):
+            return cached
+
+    r_info = moonraker_get(f"{base}/printer/info")
+    r_info.raise_for_status()
+    info = r_info.json()["result"]
+
+    entry = {
+        "ts": time.time(),
+        "hostname": info["hostname"],
+        "software_version": info.get("software_version"),
+        "helm_version": fetch_helm_version(base),
+    }
+    with printer_info_cache_lock:
+        printer_info_cache[base] = entry
+    return entry
+
+def build_device_row(base: str, ip: str, mac: str, static_info: Dict[str, Any], objects: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn printer info + Klipper object status into the device dict the UI expects.
+    Raises KeyError when required objects are missing.
+    """
+    hostname = static_info["hostname"]
+    software_version = static_info.get("software_version")
+    helm_version = static_info.get("helm_version")
+    state_message = objects.get("webhooks", {}).get("state_message")
+
+    status = objects["idle_timeout"]["state"]
+
+    # Print progress + file path
+    vs = objects.get("virtual_sdcard", {})
+    print_progress = vs.get("progress", 0)
+    file_path = vs.get("file_path")
+
+    thumbnail_url = None
+    if file_path and file_path.startswith("/home/pi/printer_data/gcodes/"):
+        stripped = file_path.removeprefix("/home/pi/printer_data/gcodes/")
+        thumbnail_url = f"/api/thumbnails/{requests.utils.quote(hostname)}/{requests.utils.quote(stripped)}"
+
+    # Temps (may not exist on all printers; guard with .get)
+    return {
+        "hostname": hostname,
+        "ip": ip,
+        "mac": mac,
+        "base_url": base,
+        "ui_url": f"http://{ip}",
+        "software_version": software_version,
+        "state_message": state_message,
+        "status": status,
+        "extruder_temperature": objects.get("extruder", {}).get("temperature"),
+        "extruder_target": objects.get("extruder", {}).get("target"),
+        "extruder1_temperature": objects.get("extruder1", {}).get("temperature"),
+        "extruder1_target": objects.get("extruder1", {}).get("target"),
+        "extruder2_temperature": objects.get("extruder2", {}).get("temperature"),
+        "extruder2_target": objects.get("extruder2", {}).get("target"),
+        "heater_bed_temperature": objects.get("heater_bed", {}).get("temperature"),
+        "heater_bed_target": objects.get("heater_bed", {}).get("target"),
+        "print_progress": print_progress,
+        "file_path": file_path,
+        "thumbnail_url": thumbnail_url,
+        "helm_version": helm_version,
+        "connection_state": "polling",
+    }
+
 def fetch_printer_details(base: str, ip: str, mac: str, devices_list, processed_hostnames) -> None:
     """
     Fetch the fields you were using before, but using `base` so it works
     whether Moonraker is on 7125, 80, etc.
+
+    Live status comes from a single batched objects query; hostname, software
+    and theme version come from the per-printer info cache.
     """
-    info_url = f"{base}/printer/info"
-    virtual_sdcard_url = f"{base}/printer/objects/query?virtual_sdcard"
-    extruder_url = f"{base}/printer/objects/query?gcode_move&toolhead&extruder=target,temperature"
-    extruder1_url = f"{base}/printer/objects/query?gcode_move&toolhead&extruder1=target,temperature"
-    extruder2_url = f"{base}/printer/objects/query?gcode_move&toolhead&extruder2=target,temperature"
-    heater_bed_url = f"{base}/printer/objects/query?gcode_move&toolhead&heater_bed=target,temperature"
-    idle_timeout_url = f"{base}/printer/objects/query?idle_timeout"
+    query_url = f"{base}/printer/objects/query?{STATUS_QUERY_OBJECTS}"
 
     try:
-        r_info = requests.get(info_url, timeout=2)
-        r_info.raise_for_status()
-        info_data = r_info.json()
-
-        r_extruder = requests.get(extruder_url, timeout=2); r_extruder.raise_for_status()
-        r_extruder1 = requests.get(extruder1_url, timeout=2); r_extruder1.raise_for_status()
-        r_extruder2 = requests.get(extruder2_url, timeout=2); r_extruder2.raise_for_status()
-        r_bed = requests.get(heater_bed_url, timeout=2); r_bed.raise_for_status()
-        r_idle = requests.get(idle_timeout_url, timeout=2); r_idle.raise_for_status()
-        r_vsd = requests.get(virtual_sdcard_url, timeout=2); r_vsd.raise_for_status()
-
-        extruder_data = r_extruder.json()
-        extruder1_data = r_extruder1.json()
-        extruder2_data = r_extruder2.json()
-        heater_bed_data = r_bed.json()
-        idle_timeout_data = r_idle.json()
-        virtual_sdcard_data = r_vsd.json()
-
-        hostname = info_data["result"]["hostname"]
-        software_version = info_data["result"].get("software_version")
-        state_message = info_data["result"].get("state_message")
-
-        status = idle_timeout_data["result"]["status"]["idle_timeout"]["state"]
-
-        # Print progress + file path
-        vs = virtual_sdcard_data["result"]["status"]["virtual_sdcard"]
-        print_progress = vs.get("progress", 0)
-        file_path = vs.get("file_path")
-
-        thumbnail_url = None
-        if file_path and file_path.startswith("/home/pi/printer_data/gcodes/"):
-            stripped = file_path.removeprefix("/home/pi/printer_data/gcodes/")
-            thumbnail_url = f"{base}/server/files/thumbnails?filename={requests.utils.quote(stripped)}"
-
-        # Temps (may not exist on all printers; guard with .get)
-        extruder_temperature = extruder_data["result"]["status"].get("extruder", {}).get("temperature")
-        extruder_target = extruder_data["result"]["status"].get("extruder", {}).get("target")
-        extruder1_temperature = extruder1_data["result"]["status"].get("extruder1", {}).get("temperature")
-        extruder1_target = extruder1_data["result"]["status"].get("extruder1", {}).get("target")
-        extruder2_temperature = extruder2_data["result"]["status"].get("extruder2", {}).get("temperature")
-        extruder2_target = extruder2_data["result"]["status"].get("extruder2", {}).get("target")
-        heater_bed_temperature = heater_bed_data["result"]["status"].get("heater_bed", {}).get("temperature")
-        heater_bed_target = heater_bed_data["result"]["status"].get("heater_bed", {}).get("target")
-
-        # Fetch helm theme version from custom CSS (non-blocking; None = legacy)
-        helm_version = None
-        try:
-            css_url = f"{base}/server/files/config/.theme/custom.css"
-            r_css = requests.get(css_url, timeout=2)
-            if r_css.ok:
-                m = re.search(r'content:\s*["\'][^"\']*?v([\d][^\s"\']+)', r_css.text)
-                if m:
-                    helm_version = m.group(1)
-        except requests.RequestException:
-            pass
+        static_info = get_printer_static_info(base)
+
+        r_query = moonraker_get(query_url)
+        r_query.raise_for_status()
+        objects = r_query.json()["result"]["status"]
+
+        row = build_device_row(base, ip, mac, static_info, objects)
+        hostname = row["hostname"]
 
         with device_list_lock:
             if hostname in processed_hostnames:
                 return
             processed_hostnames.add(hostname)
-            devices_list.append({
-                "hostname": hostname,
-                "ip": ip,
-                "mac": mac,
-                "base_url": base,
-                "ui_url": f"http://{ip}",
-                "software_version": software_version,
-                "state_message": state_message,
-                "status": status,
-                "extruder_temperature": extruder_temperature,
-                "extruder_target": extruder_target,
-                "extruder1_temperature": extruder1_temperature,
-                "extruder1_target": extruder1_target,
-                "extruder2_temperature": extruder2_temperature,
-                "extruder2_target": extruder2_target,
-                "heater_bed_temperature": heater_bed_temperature,
-                "heater_bed_target": heater_bed_target,
-                "print_progress": print_progress,
-                "file_path": file_path,
-                "thumbnail_url": thumbnail_url,
-                "helm_version": helm_version,
-            })
+            devices_list.append(row)
 
     except requests.RequestException as e:
         logger.info("Query failed for %s via %s: %s", ip, base, e)
     except (KeyError, TypeError, ValueError) as e:
         logger.info("Unexpected JSON shape for %s via %s: %s", ip, base, e)
 
-def probe_and_collect(ip: str, mac: str, ports: List[int], devices_list, processed_hostnames) -> None:
+def probe_and_collect(ip: str, mac: str, open_ports: List[int], devices_list, processed_hostnames) -> None:
     """
-    Worker: quick port check then Moonraker probe then details fetch.
+    Worker: Moonraker probe then details fetch, for ports already known to be open.
     """
-    open_ports = [p for p in ports if port_open(ip, p)]
-    if not open_ports:
-        return
-
     base = pick_moonraker_base(ip, open_ports)
     if not base:
         return
 
     fetch_printer_details(base, ip, mac, devices_list, processed_hostnames)
 
+# ---------------------------
+# ✅ Async probe engine
+# ---------------------------
+#
+# TCP connect probes run on one background asyncio loop, so a whole /22 sweep
+# is limited by ASYNC_CONNECT_CONCURRENCY instead of a small thread pool and
+# finishes in roughly one connect timeout. Moonraker HTTP calls still use the
+# pooled `requests` session, offloaded to a bounded executor from the loop.
+# Flask routes (plain threads) call in through run_async().
+
+ASYNC_CONNECT_CONCURRENCY = _env_number("HELM_ASYNC_CONNECT_CONCURRENCY", 1024)
+ASYNC_HTTP_CONCURRENCY = _env_number("HELM_ASYNC_HTTP_CONCURRENCY", 64)
+
+_async_loop_lock = threading.Lock()
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+_async_connect_sem: Optional[asyncio.Semaphore] = None
+_async_http_sem: Optional[asyncio.Semaphore] = None
+_async_http_pool: Optional[ThreadPoolExecutor] = None
+
+def _raise_fd_limit(wanted: int) -> int:
+    """
+    Each in-flight connect holds a socket. Raise the soft fd limit where the
+    platform allows it and return a concurrency that fits under it.
+    """
+    try:
+        import resource
+    except ImportError:
+        return wanted  # Windows: no per-process fd soft limit for sockets
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        target = wanted + 256
+        if hard != resource.RLIM_INFINITY:
+            target = min(target, hard)
+        if soft != resource.RLIM_INFINITY and soft < target:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        if soft != resource.RLIM_INFINITY:
+            return max(16, min(wanted, soft - 256))
+    except (ValueError, OSError):
+        pass
+    return wanted
+
+def get_async_loop() -> asyncio.AbstractEventLoop:
+    global _async_loop, _async_connect_sem, _async_http_sem, _async_http_pool
+    with _async_loop_lock:
+        if _async_loop is not None:
+            return _async_loop
+
+        loop = asyncio.new_event_loop()
+        connect_limit = _raise_fd_limit(ASYNC_CONNECT_CONCURRENCY)
+        _async_http_pool = ThreadPoolExecutor(max_workers=ASYNC_HTTP_CONCURRENCY, thread_name_prefix="moonraker-http")
+        loop.set_default_executor(_async_http_pool)
+
+        async def _make_semaphores():
+            return asyncio.Semaphore(connect_limit), asyncio.Semaphore(ASYNC_HTTP_CONCURRENCY)
+
+        t = threading.Thread(target=loop.run_forever, name="helm-async", daemon=True)
+        t.start()
+        _async_connect_sem, _async_http_sem = asyncio.run_coroutine_threadsafe(_make_semaphores(), loop).result()
+        _async_loop = loop
+        logger.info("Async probe engine started (connect limit=%d, http limit=%d)", connect_limit, ASYNC_HTTP_CONCURRENCY)
+        return loop
+
+def run_async(coro, timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the shared engine loop from synchronous (Flask) code.
+    """
+    loop = get_async_loop()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+async def port_open_async(ip: str, port: int, timeout: float = 0.25) -> bool:
+    """
+    Async version of port_open, bounded by the global connect limit.
+    """
+    async with _async_connect_sem:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+
+async def run_blocking_async(fn: Callable, *args) -> Any:
+    """
+    Run a blocking (requests-based) call on the bounded HTTP executor.
+    """
+    async with _async_http_sem:
+        return await asyncio.get_running_loop().run_in_executor(_async_http_pool, fn, *args)
+
+async def _gather_quiet(coros) -> None:
+    for res in await asyncio.gather(*coros, return_exceptions=True):
+        if isinstance(res, BaseException):
+            logger.debug("Async worker failed: %s", res)
+
+async def _probe_host_async(ip: str, mac: str, ports: List[int], devices_list, processed_hostnames) -> None:
+    results = await asyncio.gather(*(port_open_async(ip, p) for p in ports))
+    open_ports = [p for p, ok in zip(ports, results) if ok]
+    if not open_ports:
+        return
+    await run_blocking_async(probe_and_collect, ip, mac, open_ports, devices_list, processed_hostnames)
+
+async def sweep_async(targets: List[Tuple[str, str]], ports: List[int], devices_list, processed_hostnames) -> None:
+    """
+    Connect-probe every (ip, mac) target concurrently, then Moonraker-probe the hits.
+    """
+    await _gather_quiet(_probe_host_async(ip, mac, ports, devices_list, processed_hostnames) for ip, mac in targets)
+
+async def refresh_async(entries: List[Dict[str, Any]], devices_list, processed_hostnames) -> None:
+    await _gather_quiet(
+        run_blocking_async(fetch_printer_details, e["base_url"], e.get("ip"), e.get("mac") or "", devices_list, processed_hostnames)
+        for e in entries
+    )
+
+def arp_entries_in_cidr(cidr: str) -> Tuple[Optional[Any], List[Tuple[str, str]]]:
+    """
+    ARP table entries inside `cidr`, plus the parsed network (None if the CIDR
+    doesn't parse, in which case all entries are returned).
+    """
+    arp_entries = read_neighbor_table()
+    logger.info("Neighbor table entries: %d", len(arp_entries))
+
+    # Filter ARP entries to only those in the specified CIDR
+    net = None
+    try:
+        net = ipaddress.ip_network(cidr, strict=False)
+        filtered_entries = []
+        for ip, mac in arp_entries:
+            try:
+                ip_addr = ipaddress.ip_address(ip)
+                if ip_addr in net:
+                    filtered_entries.append((ip, mac))
+            except:
+                pass
+        logger.info("Filtered to %d entries in CIDR %s", len(filtered_entries), cidr)
+    except:
+        logger.warning("Failed to parse CIDR %s, using all ARP entries", cidr)
+        filtered_entries = arp_entries
+    return net, filtered_entries
+
 def discover_devices(
     cidr: str,
     warm: bool,
     ports: List[int],
     cache_ttl_s: Optional[float] = None,
     force: bool = False,
-) -> List[Dict[str, Any]]:
-    t0 = time.time()
+) -> Tuple[Mapping[str, Any], ...]:
+    """
+    Full discovery (ARP + sweep + probe), cached per (cidr, ports, warm).
+    Concurrent callers share one sweep; stale results are served while a
+    background sweep refreshes them. Returns an immutable snapshot.
+    """
     ttl = DISCOVERY_CACHE_TTL_S if cache_ttl_s is None else max(0.0, float(cache_ttl_s))
-    cache_key = (str(cidr), tuple(sorted(int(p) for p in ports)), bool(warm))
+    cache_key = ("discovery", str(cidr), tuple(sorted(int(p) for p in ports)), bool(warm))
+    return cached_snapshot(
+        cache_key,
+        ttl_s=ttl,
+        stale_s=DISCOVERY_STALE_S,
+        compute=lambda: _discover_devices_uncached(cidr, warm, ports),
+        force=force,
+    )
 
-    if not force and ttl > 0:
-        with discovery_cache_lock:
-            cached = discovery_cache.get(cache_key)
-            if cached and (time.time() - float(cached.get("ts", 0.0)) <= ttl):
-                return copy.deepcopy(cached.get("devices", []))
+def _discover_devices_uncached(cidr: str, warm: bool, ports: List[int]) -> Tuple[Mapping[str, Any], ...]:
+    t0 = time.time()
 
     try:
         my_ip = get_my_ipv4()
@@ -621,25 +1199,7 @@ def discover_devices(
             else:
                 logger.info("Skipping warm sweep (cooldown active) for CIDR %s", cidr)
 
-        arp_entries = parse_arp_a()
-        logger.info("arp -a entries: %d", len(arp_entries))
-
-        # Filter ARP entries to only those in the specified CIDR
-        net = None
-        try:
-            net = ipaddress.ip_network(cidr, strict=False)
-            filtered_entries = []
-            for ip, mac in arp_entries:
-                try:
-                    ip_addr = ipaddress.ip_address(ip)
-                    if ip_addr in net:
-                        filtered_entries.append((ip, mac))
-                except:
-                    pass
-            logger.info("Filtered to %d entries in CIDR %s", len(filtered_entries), cidr)
-        except:
-            logger.warning("Failed to parse CIDR %s, using all ARP entries", cidr)
-            filtered_entries = arp_entries
+        net, filtered_entries = arp_entries_in_cidr(cidr)
 
         # Build probe targets using ARP + active host probing for manageable subnets.
         probe_map: Dict[str, str] = {ip: mac for ip, mac in filtered_entries if ip != my_ip}
@@ -662,25 +1222,12 @@ def discover_devices(
 
         probe_targets = list(probe_map.items())
         if probe_targets:
-            workers = min(DISCOVERY_MAX_WORKERS, len(probe_targets))
-            with ThreadPoolExecutor(max_workers=workers) as pool:
-                futures = [
-                    pool.submit(probe_and_collect, ip, mac, ports, devices_list, processed_hostnames)
-                    for ip, mac in probe_targets
-                ]
-                for fut in as_completed(futures):
-                    try:
-                        fut.result()
-                    except Exception:
-                        pass
+            run_async(sweep_async(probe_targets, ports, devices_list, processed_hostnames))
 
         logger.info("Printers found: %d", len(devices_list))
-
-        with discovery_cache_lock:
-            discovery_cache[cache_key] = {
-                "ts": time.time(),
-                "devices": copy.deepcopy(devices_list),
-            }
+        registry_upsert_devices(devices_list)
+        with discovery_jobs_lock:
+            last_full_sweep_ts[(str(cidr), tuple(sorted(int(p) for p in ports)))] = time.time()
 
         # ✅ health snapshot on success
         try:
@@ -692,7 +1239,7 @@ def discover_devices(
         except Exception:
             pass
 
-        return devices_list
+        return freeze_devices(devices_list)
 
     except Exception as e:
         # ✅ health snapshot on failure
@@ -707,38 +1254,795 @@ def discover_devices(
         raise
 
 # ---------------------------
-# History aggregation helpers
+# ✅ Printer registry (slow discovery vs. fast status refresh)
 # ---------------------------
+#
+# Discovery (ARP + port sweep + Moonraker probe) is expensive and only needs to
+# run occasionally. Every printer it finds is remembered here by hostname, and
+# the request path only refreshes status for printers we already know about.
+
+REGISTRY_DISCOVERY_INTERVAL_S = 10.0
+REGISTRY_FULL_SWEEP_INTERVAL_S = 15 * 60.0
+REGISTRY_STALE_AFTER_S = 15 * 60.0
+REGISTRY_JOB_IDLE_EXIT_S = 10 * 60.0
+
+REGISTRY_SAVE_MIN_INTERVAL_S = 60.0
+REGISTRY_FORGET_AFTER_S = 30 * 24 * 3600.0
+
+printer_registry_lock = threading.Lock()
+# hostname -> {"hostname", "ip", "mac", "base_url", "port", "last_seen", "helm_version"}
+printer_registry: Dict[str, Dict[str, Any]] = {}
+# "loaded_ts": when printers.json was read (entries get a fresh stale window from then)
+registry_state: Dict[str, Any] = {"loaded": False, "loaded_ts": 0.0, "last_save": 0.0}
+
+printers_file_lock = threading.Lock()
+
+# Scan scopes come from the client, so they are normalized and bounded:
+# private/link-local IPv4 only (or inside HELM_SCAN_NETWORKS when set), no
+# larger than a /SCAN_MIN_PREFIX, and at most DISCOVERY_JOB_LIMIT live jobs.
+DEFAULT_SCAN_CIDR = os.environ.get("HELM_DEFAULT_CIDR", "192.168.1.0/24")
+SCAN_MIN_PREFIX = 16
+DISCOVERY_JOB_LIMIT = 8
+
+def _parse_scan_networks(raw: str) -> List[Any]:
+    nets = []
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        try:
+            nets.append(ipaddress.ip_network(part.strip(), strict=False))
+        except ValueError:
+            logger.warning("Ignoring invalid network %r in HELM_SCAN_NETWORKS", part.strip())
+    return nets
 
-def moonraker_get_json(base: str, path: str, timeout: float = 2.5) -> Optional[Any]:
-    url = f"{base}{path}"
+SCAN_NETWORKS = _parse_scan_networks(os.environ.get("HELM_SCAN_NETWORKS", ""))
+
+def normalize_scan_cidr(cidr: Any) -> Optional[str]:
+    """
+    Canonical form of a client-supplied scan CIDR (so "10.0.0.7/24" and
+    "10.0.0.0/24" share one discovery job), or None if it isn't allowed.
+    """
     try:
-        logger.debug(f"[moonraker_get_json] GET {url}")
-        r = requests.get(url, timeout=timeout)
-        r.raise_for_status()
-        result = r.json()
-        logger.debug(f"[moonraker_get_json] Response: {type(result)} - {str(result)[:200]}")
-        return result
-    except Exception as e:
-        logger.error(f"[moonraker_get_json] Error fetching {url}: {e}")
+        net = ipaddress.ip_network(str(cidr or "").strip(), strict=False)
+    except ValueError:
+        return None
+    if net.version != 4 or net.prefixlen < SCAN_MIN_PREFIX:
+        return None
+    if SCAN_NETWORKS:
+        allowed = any(n.version == 4 and net.subnet_of(n) for n in SCAN_NETWORKS)
+    else:
+        allowed = net.is_private or net.is_link_local
+    return str(net) if allowed else None
+
+SCAN_CIDR_ERROR = {"error": f"cidr must be a private IPv4 network no larger than /{SCAN_MIN_PREFIX} (see HELM_SCAN_NETWORKS)"}
+
+discovery_jobs_lock = threading.Lock()
+# (cidr, ports) -> {"thread": Thread, "last_request": float, "warm": bool, "arp_snapshot": {ip: mac}}
+discovery_jobs: Dict[Tuple[str, Tuple[int, ...]], Dict[str, Any]] = {}
+# (cidr, ports) -> time of the last full sweep (discover_devices)
+last_full_sweep_ts: Dict[Tuple[str, Tuple[int, ...]], float] = {}
+
+
+def _port_from_base(base: str) -> Optional[int]:
+    m = re.match(r"^https?://[^/:]+:(\d+)", str(base or ""))
+    if m:
+        return int(m.group(1))
+    return 80 if str(base or "").startswith("http://") else None
+
+def save_printer_registry() -> None:
+    """
+    Persist the registry next to users.json (atomic replace, like save_users_doc).
+    """
+    with printer_registry_lock:
+        doc = {"printers": sorted((dict(e) for e in printer_registry.values()), key=lambda e: e["hostname"])}
+        registry_state["last_save"] = time.time()
+    ensure_data_dir()
+    with printers_file_lock:
+        tmp = PRINTERS_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        os.replace(tmp, PRINTERS_FILE)
+
+def load_printer_registry() -> None:
+    """
+    Load printers.json once at startup so the dashboard can be filled by a
+    status refresh instead of a cold sweep. Also starts live subscriptions.
+    """
+    with printer_registry_lock:
+        if registry_state["loaded"]:
+            return
+        registry_state["loaded"] = True
+        registry_state["loaded_ts"] = time.time()
+
+    doc: Dict[str, Any] = {}
+    with printers_file_lock:
+        if os.path.isfile(PRINTERS_FILE):
+            try:
+                with open(PRINTERS_FILE, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+            except Exception as e:
+                logger.warning("Ignoring unreadable %s: %s", PRINTERS_FILE, e)
+                doc = {}
+
+    printers = doc.get("printers") if isinstance(doc, dict) else None
+    if not isinstance(printers, list):
+        return
+
+    cutoff = time.time() - REGISTRY_FORGET_AFTER_S
+    loaded: List[Dict[str, Any]] = []
+    with printer_registry_lock:
+        for e in printers:
+            if not isinstance(e, dict) or not e.get("hostname") or not e.get("base_url"):
+                continue
+            last_seen = _float_or_none(e.get("last_seen")) or 0.0
+            if last_seen < cutoff:
+                continue
+            hostname = str(e["hostname"])
+            if hostname in printer_registry:
+                continue  # already refreshed by discovery
+            printer_registry[hostname] = {
+                "hostname": hostname,
+                "ip": e.get("ip"),
+                "mac": e.get("mac") or "",
+                "base_url": e["base_url"],
+                "port": e.get("port") if e.get("port") is not None else _port_from_base(e["base_url"]),
+                "last_seen": last_seen,
+                "helm_version": e.get("helm_version"),
+            }
+            loaded.append(printer_registry[hostname])
+
+    logger.info("Loaded %d printers from %s", len(loaded), PRINTERS_FILE)
+    for e in loaded:
+        ensure_live_subscription(e["hostname"], e["base_url"], e.get("ip"), e.get("mac") or "")
+
+def registry_upsert_devices(devices: List[Dict[str, Any]]) -> None:
+    """
+    Remember (or refresh) printers by hostname. A printer that moved to a new
+    IP simply overwrites its old entry. Saved to disk when something other
+    than last_seen changed, or at most every REGISTRY_SAVE_MIN_INTERVAL_S.
+    """
+    load_printer_registry()
+    now = time.time()
+    changed = False
+    with printer_registry_lock:
+        for d in devices:
+            hostname = str(d.get("hostname") or "")
+            base = d.get("base_url")
+            if not hostname or not base:
+                continue
+            entry = printer_registry.get(hostname) or {"hostname": hostname}
+            before = (entry.get("ip"), entry.get("mac"), entry.get("base_url"), entry.get("helm_version"))
+            entry["ip"] = d.get("ip")
+            entry["mac"] = d.get("mac") or entry.get("mac") or ""
+            entry["base_url"] = base
+            entry["port"] = _port_from_base(base)
+            entry["last_seen"] = now
+            entry["helm_version"] = d.get("helm_version")
+            if before != (entry["ip"], entry["mac"], entry["base_url"], entry["helm_version"]):
+                changed = True
+            printer_registry[hostname] = entry
+        save_due = changed or (devices and now - float(registry_state["last_save"]) >= REGISTRY_SAVE_MIN_INTERVAL_S)
+
+    if save_due:
+        try:
+            save_printer_registry()
+        except OSError as e:
+            logger.warning("Failed to save %s: %s", PRINTERS_FILE, e)
+
+    for d in devices:
+        if d.get("hostname") and d.get("base_url"):
+            ensure_live_subscription(str(d["hostname"]), d["base_url"], d.get("ip"), d.get("mac") or "")
+
+def registry_entries_for(cidr: str, ports: List[int]) -> List[Dict[str, Any]]:
+    """
+    Known printers inside `cidr` answering on one of `ports`, skipping entries
+    that have not been seen for REGISTRY_STALE_AFTER_S.
+    """
+    try:
+        net = ipaddress.ip_network(cidr, strict=False)
+    except ValueError:
+        net = None
+    load_printer_registry()
+    port_set = set(int(p) for p in ports)
+    cutoff = time.time() - REGISTRY_STALE_AFTER_S
+
+    out: List[Dict[str, Any]] = []
+    with printer_registry_lock:
+        for entry in printer_registry.values():
+            # Entries loaded from disk get a fresh window from startup to prove themselves
+            if max(float(entry.get("last_seen") or 0.0), float(registry_state["loaded_ts"])) < cutoff:
+                continue
+            if entry.get("port") is not None and entry.get("port") not in port_set:
+                continue
+            if net is not None:
+                try:
+                    if ipaddress.ip_address(str(entry.get("ip"))) not in net:
+                        continue
+                except ValueError:
+                    continue
+            out.append(dict(entry))
+    return out
+
+def refresh_registered_printers(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Status-only refresh for printers already in the registry (no sweep, no probe).
+    Printers that fail to answer are left out, just like discovery would.
+    """
+    devices_list: List[Dict[str, Any]] = []
+    processed_hostnames = set()
+    if not entries:
+        return devices_list
+
+    run_async(refresh_async(entries, devices_list, processed_hostnames))
+
+    live_states = {e.get("hostname"): e.get("connection_state") for e in entries}
+    for d in devices_list:
+        d["connection_state"] = live_states.get(d.get("hostname")) or "polling"
+
+    registry_upsert_devices(devices_list)
+    return devices_list
+
+# ---------------------------
+# ✅ Adaptive polling schedule
+# ---------------------------
+#
+# Printers without a live websocket are polled over HTTP, but not all on every
+# /api/devices call: each one has its own next-due time. Busy printers (printing
+# or heating) are refreshed quickly, idle ones slowly, and printers that stop
+# answering back off exponentially. After POLL_CIRCUIT_FAILURES misses in a row
+# the circuit opens and the printer only gets a single probe per backoff period.
+# Intervals are jittered so a fleet added at once doesn't stay in lockstep.
+
+POLL_INTERVAL_ACTIVE_S = _env_number("HELM_POLL_ACTIVE_S", 1.0, float)
+POLL_INTERVAL_IDLE_S = _env_number("HELM_POLL_IDLE_S", 10.0, float)
+POLL_JITTER = 0.15
+POLL_BACKOFF_MIN_S = 2.0
+POLL_BACKOFF_MAX_S = 120.0
+POLL_CIRCUIT_FAILURES = 3
+
+poll_schedule_lock = threading.Lock()
+# hostname -> {"next_due", "interval", "failures", "row"}
+poll_schedule: Dict[str, Dict[str, Any]] = {}
+
+def _row_is_active(row: Mapping[str, Any]) -> bool:
+    """True when a printer is printing or has a heater target set."""
+    if str(row.get("status") or "").lower() in ("printing", "busy"):
+        return True
+    for key in ("extruder_target", "extruder1_target", "extruder2_target", "heater_bed_target"):
+        try:
+            if float(row.get(key) or 0) > 0:
+                return True
+        except (TypeError, ValueError):
+            continue
+    return False
+
+def split_due_printers(
+    entries: List[Dict[str, Any]], now: Optional[float] = None
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split polled entries into those due for a refresh and cached rows for the
+    rest. Printers in backoff are left out until their next probe.
+    """
+    now = time.time() if now is None else now
+    due: List[Dict[str, Any]] = []
+    cached: List[Dict[str, Any]] = []
+    with poll_schedule_lock:
+        for e in entries:
+            sched = poll_schedule.get(str(e.get("hostname") or ""))
+            if sched is None or now >= sched["next_due"]:
+                due.append(e)
+            elif sched["failures"] == 0 and sched["row"] is not None:
+                row = dict(sched["row"])
+                row["connection_state"] = e.get("connection_state") or "polling"
+                cached.append(row)
+    return due, cached
+
+def record_poll_results(
+    due: List[Dict[str, Any]], rows: List[Dict[str, Any]], now: Optional[float] = None
+) -> None:
+    """Reschedule refreshed printers from what came back."""
+    now = time.time() if now is None else now
+    by_host = {str(r.get("hostname") or ""): r for r in rows}
+    with poll_schedule_lock:
+        for e in due:
+            hostname = str(e.get("hostname") or "")
+            sched = poll_schedule.setdefault(
+                hostname, {"next_due": 0.0, "interval": POLL_INTERVAL_IDLE_S, "failures": 0, "row": None}
+            )
+            row = by_host.get(hostname)
+            if row is not None:
+                sched["failures"] = 0
+                sched["row"] = dict(row)
+                sched["interval"] = POLL_INTERVAL_ACTIVE_S if _row_is_active(row) else POLL_INTERVAL_IDLE_S
+            else:
+                if sched["failures"] == 0:
+                    logger.info("Printer %s stopped answering; backing off", hostname)
+                sched["failures"] += 1
+                sched["row"] = None
+                if sched["failures"] >= POLL_CIRCUIT_FAILURES:
+                    # Circuit open: one probe per max backoff period until it answers again.
+                    if sched["failures"] == POLL_CIRCUIT_FAILURES:
+                        logger.warning("Printer %s unreachable; probing every %.0fs", hostname, POLL_BACKOFF_MAX_S)
+                    sched["interval"] = POLL_BACKOFF_MAX_S
+                else:
+                    sched["interval"] = min(POLL_BACKOFF_MAX_S, POLL_BACKOFF_MIN_S * 2 ** (sched["failures"] - 1))
+            sched["next_due"] = now + sched["interval"] * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+def poll_schedule_stats() -> Dict[str, int]:
+    with poll_schedule_lock:
+        scheds = list(poll_schedule.values())
+    out = {"active": 0, "idle": 0, "backoff": 0, "circuit_open": 0}
+    for sched in scheds:
+        if sched["failures"] >= POLL_CIRCUIT_FAILURES:
+            out["circuit_open"] += 1
+        elif sched["failures"]:
+            out["backoff"] += 1
+        elif sched["interval"] <= POLL_INTERVAL_ACTIVE_S:
+            out["active"] += 1
+        else:
+            out["idle"] += 1
+    return out
+
+def incremental_discovery(cidr: str, ports: List[int], job: Dict[str, Any]) -> int:
+    """
+    Diff the ARP table against the previous snapshot for this scope and probe
+    only IP/MAC pairs that are new or changed. Returns the number probed.
+    """
+    _, entries = arp_entries_in_cidr(cidr)
+    snapshot = dict(entries)
+    prev = job.get("arp_snapshot")
+    job["arp_snapshot"] = snapshot
+    if prev is None:
+        return 0  # first run only records a baseline; the full sweep covered it
+
+    try:
+        my_ip = get_my_ipv4()
+    except OSError:
+        my_ip = ""
+    targets = [(ip, mac) for ip, mac in snapshot.items() if prev.get(ip) != mac and ip != my_ip]
+    if not targets:
+        return 0
+
+    logger.info("Incremental discovery for %s: probing %d new/changed neighbors", cidr, len(targets))
+    devices_list: List[Dict[str, Any]] = []
+    run_async(sweep_async(targets, ports, devices_list, set()))
+    registry_upsert_devices(devices_list)
+    return len(targets)
+
+def _empty_scope_backoff_s(empty_sweeps: int) -> float:
+    return min(REGISTRY_FULL_SWEEP_INTERVAL_S, REGISTRY_DISCOVERY_INTERVAL_S * 2 ** min(int(empty_sweeps), 10))
+
+def _discovery_job_loop(job_key: Tuple[str, Tuple[int, ...]], job: Dict[str, Any]) -> None:
+    """
+    Background discovery for one (cidr, ports) scope. Mostly incremental
+    (ARP diff + mDNS); a full sweep only runs every REGISTRY_FULL_SWEEP_INTERVAL_S
+    or when the registry has nothing for this scope. Exits once nobody has
+    asked for the scope in a while.
+    """
+    cidr, ports = job_key
+    while True:
+        time.sleep(REGISTRY_DISCOVERY_INTERVAL_S)
+        with discovery_jobs_lock:
+            if discovery_jobs.get(job_key) is not job:
+                return  # retired (job limit) or replaced
+            if time.time() - float(job.get("last_request", 0.0)) > REGISTRY_JOB_IDLE_EXIT_S:
+                discovery_jobs.pop(job_key, None)
+                logger.info("Stopping background discovery for %s (idle)", cidr)
+                return
+            warm = bool(job.get("warm"))
+            last_full = float(last_full_sweep_ts.get(job_key, 0.0))
+            empty_sweeps = int(job.get("empty_sweeps", 0))
+        try:
+            since_full = time.time() - last_full
+            if registry_entries_for(cidr, list(ports)):
+                job["empty_sweeps"] = 0
+                full_due = since_full >= REGISTRY_FULL_SWEEP_INTERVAL_S
+            else:
+                # Nothing found here yet: retry full sweeps with a growing gap, not every tick
+                full_due = since_full >= _empty_scope_backoff_s(empty_sweeps)
+                if full_due:
+                    job["empty_sweeps"] = empty_sweeps + 1
+            if full_due:
+                discover_devices(cidr=cidr, warm=warm, ports=list(ports), force=True)
+            else:
+                incremental_discovery(cidr, list(ports), job)
+        except Exception as e:
+            logger.info("Background discovery failed for %s: %s", cidr, e)
+
+def ensure_discovery_job(cidr: str, ports: List[int], warm: bool = False) -> None:
+    job_key = (str(cidr), tuple(sorted(int(p) for p in ports)))
+    with discovery_jobs_lock:
+        job = discovery_jobs.get(job_key)
+        if job:
+            job["last_request"] = time.time()
+            job["warm"] = bool(job.get("warm")) or warm
+            return
+        if len(discovery_jobs) >= DISCOVERY_JOB_LIMIT:
+            # Retire the least recently requested scope; its loop exits on the next tick
+            oldest = min(discovery_jobs, key=lambda k: float(discovery_jobs[k].get("last_request", 0.0)))
+            discovery_jobs.pop(oldest, None)
+            logger.info("Stopping background discovery for %s (job limit)", oldest[0])
+        job = {"thread": None, "last_request": time.time(), "warm": warm, "arp_snapshot": None, "empty_sweeps": 0}
+        t = threading.Thread(target=_discovery_job_loop, args=(job_key, job), daemon=True)
+        job["thread"] = t
+        discovery_jobs[job_key] = job
+        t.start()
+    start_mdns_discovery()
+    logger.info("Started background discovery for %s ports=%s", cidr, list(job_key[1]))
+
+def get_registered_devices(
+    cidr: str,
+    warm: bool,
+    ports: List[int],
+    cache_ttl_s: Optional[float] = None,
+    force: bool = False,
+) -> Tuple[Mapping[str, Any], ...]:
+    """
+    Fast path used by the routes: refresh status for known printers only.
+    Falls back to a (synchronous) full discovery when the registry has nothing
+    for this scope yet, or when the caller forces a rescan.
+    Returns an immutable snapshot shared between callers.
+    """
+    ensure_discovery_job(cidr, ports, warm=warm)
+
+    if force:
+        return discover_devices(cidr=cidr, warm=warm, ports=ports, force=True)
+
+    if not registry_entries_for(cidr, ports):
+        # Empty scope: reuse the last sweep for as long as the background job backs off
+        job_key = (str(cidr), tuple(sorted(int(p) for p in ports)))
+        with discovery_jobs_lock:
+            empty_sweeps = int((discovery_jobs.get(job_key) or {}).get("empty_sweeps", 0))
+        return discover_devices(cidr=cidr, warm=warm, ports=ports, cache_ttl_s=_empty_scope_backoff_s(empty_sweeps))
+
+    ttl = DEVICES_CACHE_TTL_S if cache_ttl_s is None else max(0.0, float(cache_ttl_s))
+    cache_key = ("status", str(cidr), tuple(sorted(int(p) for p in ports)))
+    return cached_snapshot(
+        cache_key,
+        ttl_s=ttl,
+        stale_s=DEVICES_STALE_S,
+        compute=lambda: _refresh_status_uncached(cidr, ports),
+    )
+
+def _refresh_status_uncached(cidr: str, ports: List[int]) -> Tuple[Mapping[str, Any], ...]:
+    t0 = time.time()
+    entries = registry_entries_for(cidr, ports)
+    devices_list, pending = live_devices_for(entries)
+    due, cached = split_due_printers(pending)
+    refreshed = refresh_registered_printers(due)
+    record_poll_results(due, refreshed)
+    devices_list.extend(refreshed)
+    devices_list.extend(cached)
+
+    try:
+        HEALTH_SNAPSHOT["last_status_refresh_ms"] = int((time.time() - t0) * 1000)
+        HEALTH_SNAPSHOT["registry_size"] = len(printer_registry)
+    except Exception:
+        pass
+
+    return freeze_devices(devices_list)
+
+# ---------------------------
+# ✅ Live status (Moonraker websocket subscriptions)
+# ---------------------------
+#
+# One persistent websocket per registered printer. We subscribe to the same
+# objects fetch_printer_details queries and apply notify_status_update deltas
+# to an in-memory table, so /api/devices can answer without touching the
+# printer. Printers whose socket isn't subscribed are polled over HTTP instead.
+
+LIVE_STATUS_ENABLED = websocket is not None
+LIVE_CONNECT_TIMEOUT_S = 3.0
+LIVE_RECV_TIMEOUT_S = 1.0
+LIVE_RESUBSCRIBE_S = 10.0
+LIVE_BACKOFF_MIN_S = 1.0
+LIVE_BACKOFF_MAX_S = 60.0
+
+live_status_lock = threading.Lock()
+# hostname -> {"base_url", "ip", "mac", "objects", "connection_state", "updated_ts", "stop", "thread"}
+live_status: Dict[str, Dict[str, Any]] = {}
+
+# Workers only write to the entry they were started for: when a printer moves,
+# the replaced worker may still be winding down after the new entry exists.
+
+def _own_live_entry(hostname: str, stop: threading.Event) -> Optional[Dict[str, Any]]:
+    """The worker's own live_status entry (caller holds live_status_lock), or None if replaced."""
+    st = live_status.get(hostname)
+    return st if st is not None and st.get("stop") is stop else None
+
+def _set_live_state(hostname: str, stop: threading.Event, connection_state: str) -> None:
+    with live_status_lock:
+        st = _own_live_entry(hostname, stop)
+        if st:
+            st["connection_state"] = connection_state
+
+def _apply_status_delta(hostname: str, stop: threading.Event, delta: Dict[str, Any], reset: bool = False) -> None:
+    with live_status_lock:
+        st = _own_live_entry(hostname, stop)
+        if not st:
+            return
+        if reset:
+            st["objects"] = {}
+        objects = st.setdefault("objects", {})
+        for obj, fields in delta.items():
+            if isinstance(fields, dict):
+                objects.setdefault(obj, {}).update(fields)
+        st["updated_ts"] = time.time()
+
+def _live_subscription_loop(hostname: str, stop: threading.Event) -> None:
+    """
+    Keep a Moonraker websocket open for one printer, reconnecting with
+    exponential backoff. connection_state is one of:
+      connecting, subscribed, klippy_not_ready, backoff, stopped
+    """
+    backoff = LIVE_BACKOFF_MIN_S
+    while not stop.is_set():
+        with live_status_lock:
+            st = _own_live_entry(hostname, stop)
+            base = st.get("base_url") if st else None
+        if not base:
+            return
+
+        ws_url = re.sub(r"^http", "ws", base, count=1) + "/websocket"
+        _set_live_state(hostname, stop, "connecting")
+        ws = None
+        try:
+            ws = websocket.create_connection(ws_url, timeout=LIVE_CONNECT_TIMEOUT_S)
+            ws.settimeout(LIVE_RECV_TIMEOUT_S)
+            # File changes may have been missed while disconnected
+            mark_gcode_index_dirty(hostname)
+
+            # Hostname / versions for the device row (cached, refreshed rarely)
+            get_printer_static_info(base)
+
+            req_id = 0
+            sub_id = None
+            sub_sent_ts = 0.0
+
+            def subscribe():
+                nonlocal req_id, sub_id, sub_sent_ts
+                req_id += 1
+                sub_id = req_id
+                sub_sent_ts = time.time()
+                ws.send(json.dumps({
+                    "jsonrpc": "2.0",
+                    "method": "printer.objects.subscribe",
+                    "params": {"objects": STATUS_OBJECT_FIELDS},
+                    "id": sub_id,
+                }))
+
+            subscribe()
+            subscribed = False
+
+            while not stop.is_set():
+                try:
+                    raw = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    if not subscribed and time.time() - sub_sent_ts > LIVE_RESUBSCRIBE_S:
+                        subscribe()
+                    continue
+
+                if not raw:
+                    break
+                msg = json.loads(raw)
+                if not isinstance(msg, dict):
+                    continue
+
+                if msg.get("id") is not None and msg.get("id") == sub_id:
+                    result = msg.get("result")
+                    if isinstance(result, dict) and isinstance(result.get("status"), dict):
+                        _apply_status_delta(hostname, stop, result["status"], reset=True)
+                        _set_live_state(hostname, stop, "subscribed")
+                        subscribed = True
+                        backoff = LIVE_BACKOFF_MIN_S
+                    else:
+                        # Klippy not connected yet; wait for notify_klippy_ready
+                        _set_live_state(hostname, stop, "klippy_not_ready")
+                        subscribed = False
+                    continue
+
+                method = msg.get("method")
+                params = msg.get("params") or []
+                if method == "notify_status_update" and params and isinstance(params[0], dict):
+                    _apply_status_delta(hostname, stop, params[0])
+                elif method == "notify_filelist_changed" and not stop.is_set():
+                    apply_filelist_change(hostname, params)
+                elif method == "notify_klippy_ready":
+                    subscribe()
+                elif method in ("notify_klippy_shutdown", "notify_klippy_disconnected"):
+                    _set_live_state(hostname, stop, "klippy_not_ready")
+                    subscribed = False
+                    sub_sent_ts = time.time()
+
+        except (websocket.WebSocketException, OSError, ValueError, KeyError, requests.RequestException) as e:
+            logger.info("Live status connection for %s (%s) dropped: %s", hostname, base, e)
+        finally:
+            if ws is not None:
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+
+        if stop.is_set():
+            break
+        _set_live_state(hostname, stop, "backoff")
+        stop.wait(backoff)
+        backoff = min(backoff * 2.0, LIVE_BACKOFF_MAX_S)
+
+    _set_live_state(hostname, stop, "stopped")
+
+def ensure_live_subscription(hostname: str, base: str, ip: Optional[str], mac: str) -> None:
+    """
+    Start (or restart, if the printer moved) the websocket worker for a printer.
+    """
+    if not LIVE_STATUS_ENABLED:
+        return
+    with live_status_lock:
+        st = live_status.get(hostname)
+        if st and st.get("base_url") == base and st["thread"].is_alive():
+            st["ip"] = ip
+            st["mac"] = mac or st.get("mac") or ""
+            return
+        if st:
+            st["stop"].set()
+
+        stop = threading.Event()
+        t = threading.Thread(target=_live_subscription_loop, args=(hostname, stop), daemon=True)
+        live_status[hostname] = {
+            "base_url": base,
+            "ip": ip,
+            "mac": mac,
+            "objects": {},
+            "connection_state": "connecting",
+            "updated_ts": 0.0,
+            "stop": stop,
+            "thread": t,
+        }
+        t.start()
+
+def live_devices_for(entries: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split registry entries into device rows served from live websocket state and
+    entries that still need an HTTP status refresh.
+    """
+    rows: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+
+    for e in entries:
+        hostname = str(e.get("hostname") or "")
+        base = e.get("base_url")
+        with live_status_lock:
+            st = live_status.get(hostname)
+            objects = copy.deepcopy(st.get("objects")) if st else None
+            state = st.get("connection_state") if st else None
+            live_base = st.get("base_url") if st else None
+        with printer_info_cache_lock:
+            static_info = printer_info_cache.get(base)
+
+        if state != "subscribed" or live_base != base or not objects or not static_info:
+            e = dict(e)
+            e["connection_state"] = state or "polling"
+            pending.append(e)
+            continue
+
+        try:
+            row = build_device_row(base, e.get("ip"), e.get("mac") or "", static_info, objects)
+        except (KeyError, TypeError, ValueError):
+            pending.append(dict(e, connection_state=state))
+            continue
+        row["connection_state"] = "subscribed"
+        rows.append(row)
+
+    if rows:
+        registry_upsert_devices(rows)
+    return rows, pending
+
+# ---------------------------
+# ✅ mDNS discovery (Moonraker zeroconf announcements)
+# ---------------------------
+#
+# Moonraker's [zeroconf] component advertises _moonraker._tcp. Printers that
+# announce themselves go straight into the registry without any sweep.
+
+MDNS_SERVICE_TYPE = "_moonraker._tcp.local."
+MDNS_RESOLVE_TIMEOUT_MS = 3000
+
+mdns_lock = threading.Lock()
+mdns_state: Dict[str, Any] = {"zeroconf": None, "browser": None}
+
+def _mdns_resolve_and_probe(zc: Any, service_type: str, name: str) -> None:
+    try:
+        info = zc.get_service_info(service_type, name, timeout=MDNS_RESOLVE_TIMEOUT_MS)
+    except Exception as e:
+        logger.info("mDNS resolve failed for %s: %s", name, e)
+        return
+    if not info or not info.port:
+        return
+
+    for ip in info.parsed_addresses():
+        if ":" in ip:
+            continue  # IPv4 only, like the rest of discovery
+        base = pick_moonraker_base(ip, [int(info.port)])
+        if not base:
+            continue
+        devices_list: List[Dict[str, Any]] = []
+        fetch_printer_details(base, ip, "", devices_list, set())
+        if devices_list:
+            logger.info("mDNS: found %s at %s", devices_list[0].get("hostname"), base)
+            registry_upsert_devices(devices_list)
+            return
+
+class _MoonrakerMdnsListener:
+    """
+    zeroconf ServiceListener; resolving blocks, so each event gets a thread.
+    """
+
+    def _probe(self, zc: Any, type_: str, name: str) -> None:
+        threading.Thread(target=_mdns_resolve_and_probe, args=(zc, type_, name), daemon=True).start()
+
+    def add_service(self, zc: Any, type_: str, name: str) -> None:
+        self._probe(zc, type_, name)
+
+    def update_service(self, zc: Any, type_: str, name: str) -> None:
+        self._probe(zc, type_, name)
+
+    def remove_service(self, zc: Any, type_: str, name: str) -> None:
+        pass  # registry entries age out via REGISTRY_STALE_AFTER_S
+
+def start_mdns_discovery() -> None:
+    """
+    Start the shared mDNS browser once. No-op when zeroconf isn't installed.
+    """
+    if Zeroconf is None:
+        return
+    with mdns_lock:
+        if mdns_state["zeroconf"] is not None:
+            return
+        try:
+            zc = Zeroconf()
+            mdns_state["browser"] = ServiceBrowser(zc, MDNS_SERVICE_TYPE, _MoonrakerMdnsListener())
+            mdns_state["zeroconf"] = zc
+            logger.info("mDNS browser started for %s", MDNS_SERVICE_TYPE)
+        except Exception as e:
+            logger.warning("mDNS discovery unavailable: %s", e)
+            mdns_state["zeroconf"] = False
+
+# ---------------------------
+# History aggregation helpers
+# ---------------------------
+
+def moonraker_get_json(base: str, path: str, timeout: float = 2.5) -> Optional[Any]:
+    url = f"{base}{path}"
+    try:
+        logger.debug(f"[moonraker_get_json] GET {url}")
+        r = moonraker_get(url, timeout=timeout)
+        r.raise_for_status()
+        result = r.json()
+        logger.debug(f"[moonraker_get_json] Response: {type(result)} - {str(result)[:200]}")
+        return result
+    except Exception as e:
+        logger.error(f"[moonraker_get_json] Error fetching {url}: {e}")
         return None
 
 # ---------------------------
 # ✅ NEW: Fleet gcode file listing helper
 # ---------------------------
 
-def fetch_gcodes_for_printer(base: str, timeout: float = 6.0) -> List[str]:
+GCODE_EXTENSIONS = (".gcode", ".gco", ".gc")
+
+def fetch_gcode_entries(base: str, timeout: float = 6.0) -> Optional[List[Dict[str, Any]]]:
     """
-    Query Moonraker for gcodes list.
-    Returns relative paths under gcodes root, e.g.:
-      "benchy.gcode"
-      "folder/subpart.gcode"
+    Query Moonraker for the gcodes root listing.
+    Returns [{"path", "size", "modified", "permissions"}] (paths relative to the gcodes root),
+    or None when the printer couldn't be listed.
     """
     j = moonraker_get_json(base, "/server/files/list?root=gcodes", timeout=timeout)
-    
+    if j is None:
+        return None
+
     # Handle different response formats
     files = []
-    
+
     # Case 1: Direct array response
     if isinstance(j, list):
         files = j
@@ -752,11 +2056,11 @@ def fetch_gcodes_for_printer(base: str, timeout: float = 6.0) -> List[str]:
         # Case 4: Just try to use it as-is if it has properties
         else:
             files = [j] if j else []
-    
+
     if not isinstance(files, list):
         return []
 
-    out: List[str] = []
+    out: List[Dict[str, Any]] = []
     for f in files:
         if not isinstance(f, dict):
             continue
@@ -764,9 +2068,160 @@ def fetch_gcodes_for_printer(base: str, timeout: float = 6.0) -> List[str]:
         p = str(p).strip()
         if not p:
             continue
-        if not p.lower().endswith((".gcode", ".gco", ".gc")):
+        if not p.lower().endswith(GCODE_EXTENSIONS):
             continue
-        out.append(p)
+        out.append({"path": p, **_gcode_meta(f)})
+    return out
+
+def _gcode_meta(f: Dict[str, Any]) -> Dict[str, Any]:
+    return {"size": f.get("size"), "modified": f.get("modified"), "permissions": f.get("permissions")}
+
+def fetch_gcodes_for_printer(base: str, timeout: float = 6.0) -> List[str]:
+    """
+    Query Moonraker for gcodes list.
+    Returns relative paths under gcodes root, e.g.:
+      "benchy.gcode"
+      "folder/subpart.gcode"
+    """
+    return [f["path"] for f in (fetch_gcode_entries(base, timeout=timeout) or [])]
+
+# ---------------------------
+# ✅ Fleet gcode index
+# ---------------------------
+#
+# Per printer: path -> size/modified/permissions, listed once and then kept current
+# from the live websocket's notify_filelist_changed events. Printers without a live
+# connection are relisted after GCODE_INDEX_TTL_S; live ones only after a reconnect,
+# a directory-level change, or GCODE_INDEX_LIVE_TTL_S as a safety net.
+
+GCODE_INDEX_TTL_S = 60.0
+GCODE_INDEX_LIVE_TTL_S = 900.0
+GCODE_INDEX_WORKERS = 16
+
+gcode_index_lock = threading.Lock()
+gcode_index: Dict[str, Dict[str, Any]] = {}  # key -> {base_url, hostname, ip, files, refreshed_ts, dirty, gen, error}
+
+def _gcode_index_key(dev: Dict[str, Any]) -> str:
+    return str(dev.get("hostname") or dev.get("base_url") or "")
+
+def mark_gcode_index_dirty(hostname: str) -> None:
+    with gcode_index_lock:
+        entry = gcode_index.get(hostname)
+        if entry:
+            entry["dirty"] = True
+            entry["gen"] += 1
+
+def apply_filelist_change(hostname: str, params: List[Any]) -> None:
+    """
+    Fold Moonraker notify_filelist_changed params into the printer's index.
+    File-level actions patch the index in place; anything else forces a relist.
+    """
+    with gcode_index_lock:
+        entry = gcode_index.get(hostname)
+        if not entry:
+            return
+        files = entry["files"]
+        entry["gen"] += 1
+        for ev in params:
+            if not isinstance(ev, dict):
+                continue
+            action = ev.get("action")
+            item = ev.get("item") or {}
+            src = ev.get("source_item") or {}
+            in_gcodes = item.get("root", "gcodes") == "gcodes"
+            path = str(item.get("path") or "")
+            is_gcode = in_gcodes and path.lower().endswith(GCODE_EXTENSIONS)
+
+            if action in ("create_file", "modify_file"):
+                if is_gcode:
+                    files[path] = _gcode_meta(item)
+            elif action == "delete_file":
+                if in_gcodes:
+                    files.pop(path, None)
+            elif action == "move_file":
+                if src.get("root", "gcodes") == "gcodes":
+                    files.pop(str(src.get("path") or ""), None)
+                if is_gcode:
+                    files[path] = _gcode_meta(item)
+            elif in_gcodes or src.get("root") == "gcodes":
+                entry["dirty"] = True  # directory moves/deletes, root_update, ...
+
+def _gcode_index_is_live(hostname: str) -> bool:
+    with live_status_lock:
+        st = live_status.get(hostname)
+        return bool(st) and st.get("connection_state") in ("subscribed", "klippy_not_ready")
+
+def refresh_gcode_index(devices: List[Dict[str, Any]], force: bool = False) -> None:
+    """
+    Relist the printers whose index entry is missing, dirty or past its TTL.
+    """
+    now = time.time()
+    stale: List[Tuple[str, Dict[str, Any], int]] = []
+    with gcode_index_lock:
+        for d in devices:
+            key = _gcode_index_key(d)
+            base = d.get("base_url")
+            if not key or not base:
+                continue
+            entry = gcode_index.get(key)
+            if entry is None or entry["base_url"] != base:
+                entry = gcode_index[key] = {
+                    "base_url": base, "hostname": d.get("hostname"), "ip": d.get("ip"),
+                    "files": {}, "refreshed_ts": 0.0, "dirty": True, "gen": 0, "error": None,
+                }
+            entry["ip"] = d.get("ip")
+            ttl = GCODE_INDEX_LIVE_TTL_S if _gcode_index_is_live(key) else GCODE_INDEX_TTL_S
+            if force or entry["dirty"] or now - entry["refreshed_ts"] > ttl:
+                stale.append((key, dict(d), entry["gen"]))
+
+    if not stale:
+        return
+
+    def relist(job: Tuple[str, Dict[str, Any], int]) -> None:
+        key, d, gen = job
+        t0 = time.time()
+        entries = fetch_gcode_entries(d["base_url"])
+        with gcode_index_lock:
+            entry = gcode_index.get(key)
+            if entry is None or entry["base_url"] != d["base_url"]:
+                return
+            if entries is None:
+                entry["error"] = "file list unavailable"
+                return
+            entry["files"] = {f["path"]: {k: v for k, v in f.items() if k != "path"} for f in entries}
+            entry["refreshed_ts"] = t0
+            entry["error"] = None
+            # A change notification raced the listing: keep it, but relist next time.
+            entry["dirty"] = entry["gen"] != gen
+        logger.debug("gcode index: %s relisted (%d files)", key, len(entries))
+
+    with ThreadPoolExecutor(max_workers=min(len(stale), GCODE_INDEX_WORKERS)) as pool:
+        list(pool.map(relist, stale))
+
+def gcode_index_files(devices: List[Dict[str, Any]]) -> List[str]:
+    """
+    Unique gcode paths across the given printers, from the index.
+    """
+    keys = {_gcode_index_key(d) for d in devices}
+    all_files: set = set()
+    with gcode_index_lock:
+        for key in keys:
+            entry = gcode_index.get(key)
+            if entry:
+                all_files.update(entry["files"])
+    return sorted(all_files, key=lambda s: str(s).lower())
+
+def gcode_index_locations(devices: List[Dict[str, Any]], path: str) -> List[Dict[str, Any]]:
+    """
+    Which of the given printers hold `path`, with that copy's size/modified.
+    """
+    out: List[Dict[str, Any]] = []
+    with gcode_index_lock:
+        for d in devices:
+            entry = gcode_index.get(_gcode_index_key(d))
+            meta = entry["files"].get(path) if entry else None
+            if meta is not None:
+                out.append({"hostname": d.get("hostname"), "ip": d.get("ip"), **meta})
     return out
 
 def fetch_history_totals(base: str) -> Optional[Dict[str, Any]]:
@@ -783,12 +2238,24 @@ def fetch_history_totals(base: str) -> Optional[Dict[str, Any]]:
         return j["result"]
     return None
 
-def fetch_history_list_page(base: str, limit: int, start: int, order: str = "desc") -> Optional[Dict[str, Any]]:
+def fetch_history_list_page(
+    base: str,
+    limit: int,
+    start: int,
+    order: str = "desc",
+    since: Optional[float] = None,
+    before: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
     """
-    /server/history/list?limit=...&start=...&order=...
-    Some setups wrap under "result".
+    /server/history/list?limit=...&start=...&order=...[&since=...][&before=...]
+    since/before filter on job start_time. Some setups wrap under "result".
     """
-    j = moonraker_get_json(base, f"/server/history/list?limit={limit}&start={start}&order={order}", timeout=4.0)
+    path = f"/server/history/list?limit={limit}&start={start}&order={order}"
+    if since is not None:
+        path += f"&since={since}"
+    if before is not None:
+        path += f"&before={before}"
+    j = moonraker_get_json(base, path, timeout=4.0)
     if not isinstance(j, dict):
         return None
     if "jobs" in j and isinstance(j["jobs"], list):
@@ -797,41 +2264,910 @@ def fetch_history_list_page(base: str, limit: int, start: int, order: str = "des
         return j["result"]
     return None
 
+
+# ---------------------------
+# ✅ Thumbnail proxy cache
+# ---------------------------
+#
+# /api/thumbnails/<hostname>/<file> serves gcode thumbnails from an on-disk LRU in
+# THUMB_CACHE_DIR, keyed by (printer, path, file modified time, size variant), so each
+# thumbnail leaves a printer once per slice instead of once per dashboard client.
+# The modified time comes from the gcode index when it knows the file, otherwise
+# from a metadata lookup that is remembered for THUMB_META_TTL_S.
+
+THUMB_CACHE_MAX_BYTES = _env_number("HELM_THUMB_CACHE_MAX_BYTES", 256 * 1024 ** 2)
+THUMB_MAX_AGE_S = 60
+THUMB_META_TTL_S = 60.0
+THUMB_META_MISS_TTL_S = 10.0  # failed lookups (printer offline) are retried sooner
+THUMB_META_MAX_ENTRIES = 4096
+
+thumb_meta_lock = threading.Lock()
+# (hostname, path) -> (expires_ts, modified or None)
+thumb_meta_cache: "OrderedDict[Tuple[str, str], Tuple[float, Optional[float]]]" = OrderedDict()
+
+thumb_cache_lock = threading.Lock()
+thumb_cache_lru: "OrderedDict[str, int]" = OrderedDict()  # cache file name -> size, oldest first
+thumb_cache_state: Dict[str, Any] = {"loaded": False, "bytes": 0}
+thumb_inflight: Dict[str, threading.Event] = {}
+
+def _thumb_cache_load_locked() -> None:
+    if thumb_cache_state["loaded"]:
+        return
+    os.makedirs(THUMB_CACHE_DIR, exist_ok=True)
+    found = []
+    for name in os.listdir(THUMB_CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            st = os.stat(os.path.join(THUMB_CACHE_DIR, name))
+        except OSError:
+            continue
+        found.append((st.st_mtime, name, st.st_size))
+    for _, name, size in sorted(found):
+        thumb_cache_lru[name] = size
+    thumb_cache_state["bytes"] = sum(thumb_cache_lru.values())
+    thumb_cache_state["loaded"] = True
+
+def thumb_cache_get(name: str) -> Optional[bytes]:
+    path = os.path.join(THUMB_CACHE_DIR, name)
+    with thumb_cache_lock:
+        _thumb_cache_load_locked()
+        if name not in thumb_cache_lru:
+            return None
+        thumb_cache_lru.move_to_end(name)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+    except OSError:
+        with thumb_cache_lock:
+            thumb_cache_state["bytes"] -= thumb_cache_lru.pop(name, 0)
+        return None
+
+def thumb_cache_put(name: str, data: bytes) -> None:
+    """
+    The file is written outside thumb_cache_lock so cache hits never wait on it;
+    the lock only covers the LRU index and evictions. The name leaves the index
+    while it is rewritten, so an eviction can't unlink the fresh file.
+    """
+    path = os.path.join(THUMB_CACHE_DIR, name)
+    with thumb_cache_lock:
+        _thumb_cache_load_locked()
+        thumb_cache_state["bytes"] -= thumb_cache_lru.pop(name, 0)
+    tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.debug("Thumbnail cache write %s failed: %s", name, e)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return
+
+    with thumb_cache_lock:
+        thumb_cache_state["bytes"] += len(data) - thumb_cache_lru.pop(name, 0)
+        thumb_cache_lru[name] = len(data)
+        while thumb_cache_state["bytes"] > THUMB_CACHE_MAX_BYTES and len(thumb_cache_lru) > 1:
+            old, size = thumb_cache_lru.popitem(last=False)
+            thumb_cache_state["bytes"] -= size
+            try:
+                os.remove(os.path.join(THUMB_CACHE_DIR, old))
+            except OSError:
+                pass
+
+def fetch_thumbnail(base: str, path: str, variant: str) -> Optional[bytes]:
+    """
+    Largest (or smallest, variant="small") thumbnail Moonraker lists for a gcode file.
+    """
+    j = moonraker_get_json(base, f"/server/files/thumbnails?filename={requests.utils.quote(path)}", timeout=4.0)
+    thumbs = j.get("result") if isinstance(j, dict) else j
+    if not isinstance(thumbs, list):
+        return None
+    thumbs = [t for t in thumbs if isinstance(t, dict) and t.get("thumbnail_path")]
+    if not thumbs:
+        return None
+    pick = (min if variant == "small" else max)(thumbs, key=lambda t: int(t.get("width") or 0))
+    try:
+        r = moonraker_get(f"{base}/server/files/gcodes/{requests.utils.quote(pick['thumbnail_path'])}", timeout=6.0)
+        r.raise_for_status()
+        return r.content
+    except requests.RequestException as e:
+        logger.debug("Thumbnail fetch %s %s failed: %s", base, path, e)
+        return None
+
+def _thumbnail_file_modified(dev: Dict[str, Any], path: str) -> Optional[float]:
+    with gcode_index_lock:
+        entry = gcode_index.get(_gcode_index_key(dev))
+        meta = entry["files"].get(path) if entry else None
+    if meta is not None:
+        return _float_or_none(meta.get("modified"))
+
+    key = (str(dev.get("hostname") or dev.get("base_url")), path)
+    now = time.time()
+    with thumb_meta_lock:
+        hit = thumb_meta_cache.get(key)
+        if hit is not None and hit[0] > now:
+            return hit[1]
+    j = moonraker_get_json(dev["base_url"], f"/server/files/metadata?filename={requests.utils.quote(path)}", timeout=4.0)
+    res = j.get("result", j) if isinstance(j, dict) else None
+    modified = _float_or_none(res.get("modified")) if isinstance(res, dict) else None
+    with thumb_meta_lock:
+        thumb_meta_cache[key] = (now + (THUMB_META_TTL_S if modified is not None else THUMB_META_MISS_TTL_S), modified)
+        thumb_meta_cache.move_to_end(key)
+        while len(thumb_meta_cache) > THUMB_META_MAX_ENTRIES:
+            thumb_meta_cache.popitem(last=False)
+    return modified
+
+def get_thumbnail(dev: Dict[str, Any], path: str, variant: str) -> Tuple[Optional[bytes], str]:
+    """
+    (image bytes or None, cache key). Concurrent misses for one key share a single fetch.
+    """
+    modified = _thumbnail_file_modified(dev, path)
+    key = hashlib.sha1(
+        f"{dev.get('hostname')}\0{path}\0{modified}\0{variant}".encode("utf-8")
+    ).hexdigest()
+
+    while True:
+        data = thumb_cache_get(key)
+        if data is not None:
+            return data, key
+        with thumb_cache_lock:
+            ev = thumb_inflight.get(key)
+            leader = ev is None
+            if leader:
+                ev = thumb_inflight[key] = threading.Event()
+        if not leader:
+            ev.wait(10.0)
+            data = thumb_cache_get(key)
+            return data, key  # None if the leader's fetch failed
+
+        try:
+            data = fetch_thumbnail(dev["base_url"], path, variant)
+            if data is not None:
+                thumb_cache_put(key, data)
+            return data, key
+        finally:
+            with thumb_cache_lock:
+                thumb_inflight.pop(key, None)
+            ev.set()
+
+# ---------------------------
+# ✅ Local job-history store (SQLite, synced incrementally)
+# ---------------------------
+#
+# Every printer's job history is mirrored into DATA_DIR/history.sqlite3.
+# A sync only asks Moonraker for jobs started since the newest one we hold
+# (plus any still in progress), and backfills older pages a batch at a time.
+# Aggregates then page through the local copy instead of the printer.
+
+HISTORY_SYNC_MIN_INTERVAL_S = 30.0
+HISTORY_SYNC_PAGE_LIMIT = 200
+HISTORY_SYNC_MAX_PAGES = 25
+
+HISTORY_DB_VERSION = 3  # 1: jobs + sync_state, 2: rollups, 3: head sync cursor
+
+_history_db_local = threading.local()
+history_sync_locks_lock = threading.Lock()
+history_sync_locks: Dict[str, threading.Lock] = {}
+
+def history_db() -> sqlite3.Connection:
+    """
+    Per-thread connection to the history store (created on first use).
+    """
+    conn = getattr(_history_db_local, "conn", None)
+    if conn is not None and getattr(_history_db_local, "path", None) == HISTORY_DB_FILE:
+        return conn
+
+    ensure_data_dir()
+    conn = sqlite3.connect(HISTORY_DB_FILE, timeout=10.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            printer TEXT NOT NULL,
+            job_id TEXT NOT NULL,
+            status TEXT,
+            start_time REAL,
+            end_time REAL,
+            total_duration REAL,
+            print_duration REAL,
+            filament_used REAL,
+            filename TEXT,
+            job_json TEXT NOT NULL,
+            PRIMARY KEY (printer, job_id)
+        );
+        CREATE INDEX IF NOT EXISTS jobs_printer_start ON jobs (printer, start_time DESC);
+        CREATE TABLE IF NOT EXISTS sync_state (
+            printer TEXT PRIMARY KEY,
+            backfill_done INTEGER NOT NULL DEFAULT 0,
+            last_sync REAL,
+            head_since REAL,
+            head_before REAL
+        );
+        CREATE TABLE IF NOT EXISTS gcode_pushes (
+            printer TEXT NOT NULL,
+            path TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            size INTEGER,
+            modified REAL,
+            pushed_ts REAL NOT NULL,
+            PRIMARY KEY (printer, path)
+        );
+        CREATE TABLE IF NOT EXISTS rollups (
+            printer TEXT NOT NULL,
+            month TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            hours REAL NOT NULL DEFAULT 0,
+            last_end REAL,
+            PRIMARY KEY (printer, month, bucket)
+        );
+    """)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < HISTORY_DB_VERSION:
+        with conn:
+            if version < 2:
+                # Stores written before the rollups existed: derive them once from the jobs table.
+                rebuild_history_rollups(conn)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sync_state)")}
+            for column in ("head_since", "head_before"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE sync_state ADD COLUMN {column} REAL")
+            conn.execute(f"PRAGMA user_version = {HISTORY_DB_VERSION}")
+    _history_db_local.conn = conn
+    _history_db_local.path = HISTORY_DB_FILE
+    return conn
+
+def _float_or_none(v: Any) -> Optional[float]:
+    try:
+        return None if v is None else float(v)
+    except (TypeError, ValueError):
+        return None
+
+# Rollups: per printer x month ("YYYY-MM") x status bucket, kept in step with the
+# jobs table so fleet analytics never have to re-walk job history.
+
+_MONTH_ABBR = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def _month_key_from_ts(ts: Optional[float]) -> str:
+    if not ts:
+        return ""
+    try:
+        return datetime.fromtimestamp(float(ts)).strftime("%Y-%m")
+    except Exception:
+        return ""
+
+def _month_label_from_key(key: str) -> str:
+    """
+    "2026-01" -> "Jan 2026" (same labels as _month_label_from_ts).
+    """
+    return f"{_MONTH_ABBR[int(key[5:7]) - 1]} {key[:4]}"
+
+def _month_key_from_label(label: str) -> str:
+    """
+    "Jan 2026" -> "2026-01"; "" when the label isn't in that form.
+    """
+    try:
+        mon, year = label.split()
+        return f"{int(year):04d}-{_MONTH_ABBR.index(mon) + 1:02d}"
+    except ValueError:
+        return ""
+
+def _job_rollup_contribution(
+    status: Optional[str],
+    start_time: Optional[float],
+    end_time: Optional[float],
+    total_duration: Optional[float],
+    print_duration: Optional[float],
+) -> Tuple[str, str, float]:
+    """
+    (month key, bucket, hours) a job adds to the rollups, using the same rules as scan_history.
+    """
+    dur_s = print_duration if print_duration is not None else total_duration
+    dur_s = max(float(dur_s or 0.0), 0.0)
+    return _month_key_from_ts(end_time or start_time), _bucket_status(status), dur_s / 3600.0
+
+def _apply_rollup_deltas(conn: sqlite3.Connection, printer: str, deltas: Dict[Tuple[str, str], List[float]]) -> None:
+    conn.executemany("""
+        INSERT INTO rollups (printer, month, bucket, jobs, hours, last_end) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (printer, month, bucket) DO UPDATE SET
+            jobs = jobs + excluded.jobs,
+            hours = hours + excluded.hours,
+            last_end = MAX(COALESCE(last_end, 0), COALESCE(excluded.last_end, 0))
+    """, [
+        (printer, month, bucket, int(d[0]), d[1], d[2] or None)
+        for (month, bucket), d in deltas.items()
+        if d[0] or d[1] or d[2]
+    ])
+
+def rebuild_history_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Recompute every rollup from the jobs table (caller holds the transaction).
+    """
+    conn.execute("DELETE FROM rollups")
+    per_printer: Dict[str, Dict[Tuple[str, str], List[float]]] = {}
+    for printer, status, st, et, td, pd in conn.execute(
+        "SELECT printer, status, start_time, end_time, total_duration, print_duration FROM jobs"
+    ):
+        month, bucket, hours = _job_rollup_contribution(status, st, et, td, pd)
+        d = per_printer.setdefault(printer, {}).setdefault((month, bucket), [0, 0.0, 0.0])
+        d[0] += 1
+        d[1] += hours
+        d[2] = max(d[2], float(et or 0.0))
+    for printer, deltas in per_printer.items():
+        _apply_rollup_deltas(conn, printer, deltas)
+
+def history_rollup(printers: List[str], window_jobs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Status/month breakdowns for a set of printers, read straight from the rollups.
+    With window_jobs, a printer holding more jobs than that is counted over its
+    newest window_jobs jobs instead (from the jobs table), like a paged scan would.
+    Same shape as the stats part of scan_history.
+    """
+    counts = {"completed": 0, "cancelled": 0, "error": 0, "other": 0}
+    time_hours = {"completed": 0.0, "cancelled": 0.0, "error": 0.0, "other": 0.0}
+    by_month: Dict[str, float] = {}
+    last_end_ts = 0.0
+
+    def add(month: Optional[str], bucket: str, jobs: int, hours: float, last_end: float) -> None:
+        nonlocal last_end_ts
+        counts[bucket] = counts.get(bucket, 0) + jobs
+        time_hours[bucket] = time_hours.get(bucket, 0.0) + hours
+        if month:
+            by_month[month] = by_month.get(month, 0.0) + hours
+        last_end_ts = max(last_end_ts, last_end)
+
+    conn = history_db()
+    whole = list(printers)
+    if printers and window_jobs is not None:
+        window_jobs = max(0, int(window_jobs))
+        placeholders = ",".join("?" for _ in printers)
+        sizes = dict(conn.execute(
+            f"SELECT printer, COUNT(*) FROM jobs WHERE printer IN ({placeholders}) GROUP BY printer", list(printers)
+        ).fetchall())
+        whole = [p for p in printers if sizes.get(p, 0) <= window_jobs]
+        for printer in (p for p in printers if sizes.get(p, 0) > window_jobs):
+            for status, st, et, td, pd in conn.execute("""
+                SELECT status, start_time, end_time, total_duration, print_duration
+                FROM jobs WHERE printer = ? ORDER BY start_time DESC LIMIT ?
+            """, (printer, window_jobs)):
+                month, bucket, hours = _job_rollup_contribution(status, st, et, td, pd)
+                add(month, bucket, 1, hours, float(et or 0.0))
+
+    if whole:
+        placeholders = ",".join("?" for _ in whole)
+        rows = conn.execute(f"""
+            SELECT month, bucket, SUM(jobs), SUM(hours), MAX(last_end)
+            FROM rollups WHERE printer IN ({placeholders})
+            GROUP BY month, bucket
+        """, whole).fetchall()
+        for month, bucket, jobs, hours, last_end in rows:
+            add(month, bucket, int(jobs or 0), float(hours or 0.0), float(last_end or 0.0))
+
+    return {
+        "status_breakdown": counts,
+        "status_time_hours": time_hours,
+        "by_month": by_month,
+        "by_period": [{"label": _month_label_from_key(k), "hours": float(by_month[k])} for k in sorted(by_month)],
+        "last_print_finished": _iso_from_ts(last_end_ts) if last_end_ts else None,
+    }
+
+def store_history_jobs(printer: str, jobs: List[Dict[str, Any]]) -> int:
+    """
+    Insert/update jobs for a printer and fold the change into its rollups.
+    Returns how many were new.
+    """
+    rows = []
+    for job in jobs:
+        if not isinstance(job, dict) or job.get("job_id") is None:
+            continue
+        rows.append((
+            printer,
+            str(job.get("job_id")),
+            job.get("status"),
+            _float_or_none(job.get("start_time")),
+            _float_or_none(job.get("end_time")),
+            _float_or_none(job.get("total_duration")),
+            _float_or_none(job.get("print_duration")),
+            _float_or_none(job.get("filament_used")),
+            job.get("filename"),
+            json.dumps(job),
+        ))
+    if not rows:
+        return 0
+
+    conn = history_db()
+    with conn:
+        placeholders = ",".join("?" for _ in rows)
+        known = {
+            r[0]: r[1:] for r in conn.execute(
+                f"""SELECT job_id, status, start_time, end_time, total_duration, print_duration
+                    FROM jobs WHERE printer = ? AND job_id IN ({placeholders})""",
+                [printer] + [r[1] for r in rows],
+            )
+        }
+
+        # Rollup deltas: (month, bucket) -> [jobs, hours, last_end]
+        deltas: Dict[Tuple[str, str], List[float]] = {}
+        for r in rows:
+            old_row = known.get(r[1])
+            if old_row is not None:
+                month, bucket, hours = _job_rollup_contribution(*old_row)
+                d = deltas.setdefault((month, bucket), [0, 0.0, 0.0])
+                d[0] -= 1
+                d[1] -= hours
+            month, bucket, hours = _job_rollup_contribution(r[2], r[3], r[4], r[5], r[6])
+            d = deltas.setdefault((month, bucket), [0, 0.0, 0.0])
+            d[0] += 1
+            d[1] += hours
+            d[2] = max(d[2], float(r[4] or 0.0))
+        _apply_rollup_deltas(conn, printer, deltas)
+
+        conn.executemany("""
+            INSERT INTO jobs (printer, job_id, status, start_time, end_time, total_duration,
+                              print_duration, filament_used, filename, job_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (printer, job_id) DO UPDATE SET
+                status = excluded.status,
+                start_time = excluded.start_time,
+                end_time = excluded.end_time,
+                total_duration = excluded.total_duration,
+                print_duration = excluded.print_duration,
+                filament_used = excluded.filament_used,
+                filename = excluded.filename,
+                job_json = excluded.job_json
+        """, rows)
+    note_history_rows(rows)
+    return sum(1 for r in rows if r[1] not in known)
+
+def sync_printer_history(printer: str, base: str, force: bool = False) -> Dict[str, Any]:
+    """
+    Bring the local copy of one printer's history up to date.
+      - head: jobs started after the newest stored one (and re-fetch in-progress jobs),
+        walked newest-first with a `before` cursor
+      - backfill: older pages before the oldest stored job, until the printer runs out
+    A head pass cut short by the page budget leaves (head_since, head_before) in
+    sync_state; the next sync finishes that gap before anything else.
+    Returns {"ok", "new_jobs", "pages"}.
+    """
+    with history_sync_locks_lock:
+        lock = history_sync_locks.setdefault(printer, threading.Lock())
+
+    with lock:
+        conn = history_db()
+        state = conn.execute(
+            "SELECT backfill_done, last_sync, head_since, head_before FROM sync_state WHERE printer = ?", (printer,)
+        ).fetchone()
+        backfill_done = bool(state[0]) if state else False
+        last_sync = float(state[1] or 0.0) if state else 0.0
+        resume = (state[2], float(state[3])) if state and state[3] is not None else None
+        if not force and time.time() - last_sync < HISTORY_SYNC_MIN_INTERVAL_S:
+            return {"ok": True, "new_jobs": 0, "pages": 0}
+
+        newest = conn.execute("SELECT MAX(start_time) FROM jobs WHERE printer = ?", (printer,)).fetchone()[0]
+        open_from = conn.execute(
+            "SELECT MIN(start_time) FROM jobs WHERE printer = ? AND status = 'in_progress'", (printer,)
+        ).fetchone()[0]
+
+        since = None
+        if newest is not None:
+            since = min(float(newest), float(open_from)) if open_from is not None else float(newest)
+            since -= 0.001
+
+        limit = HISTORY_SYNC_PAGE_LIMIT
+        pages = 0
+        new_jobs = 0
+        ok = True
+        head_cursor: Tuple[Optional[float], Optional[float]] = (None, None)
+
+        # Head: the interrupted pass first (if any), then everything newer than what we hold
+        head_passes = ([resume] if resume else []) + [(since, None)]
+        for pass_since, cursor in head_passes:
+            finished = False
+            while pages < HISTORY_SYNC_MAX_PAGES:
+                page = fetch_history_list_page(
+                    base, limit=limit, start=0, order="desc", since=pass_since, before=cursor
+                )
+                if page is None:
+                    ok = False
+                    break
+                pages += 1
+                jobs = page.get("jobs") or []
+                new_jobs += store_history_jobs(printer, jobs)
+                starts = [st for st in (_float_or_none(j.get("start_time")) for j in jobs) if st is not None]
+                if len(jobs) < limit or not starts:
+                    finished = True
+                    if pass_since is None and cursor is None:
+                        backfill_done = True  # first sync fetched the whole history
+                    break
+                cursor = min(starts)
+            if not finished:
+                # Jobs between pass_since and cursor are still missing. With no lower
+                # bound (first sync) the backfill walks the same range anyway.
+                if pass_since is not None and cursor is not None:
+                    head_cursor = (pass_since, cursor)
+                break
+
+        # Backfill: older than the oldest stored job
+        while ok and not backfill_done and pages < HISTORY_SYNC_MAX_PAGES:
+            oldest = conn.execute("SELECT MIN(start_time) FROM jobs WHERE printer = ?", (printer,)).fetchone()[0]
+            if oldest is None:
+                backfill_done = True
+                break
+            page = fetch_history_list_page(base, limit=limit, start=0, order="desc", before=float(oldest))
+            if page is None:
+                break
+            pages += 1
+            jobs = page.get("jobs") or []
+            new_jobs += store_history_jobs(printer, jobs)
+            if len(jobs) < limit:
+                backfill_done = True
+
+        with conn:
+            conn.execute("""
+                INSERT INTO sync_state (printer, backfill_done, last_sync, head_since, head_before)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (printer) DO UPDATE SET
+                    backfill_done = excluded.backfill_done,
+                    last_sync = excluded.last_sync,
+                    head_since = excluded.head_since,
+                    head_before = excluded.head_before
+            """, (printer, int(backfill_done), time.time() if ok else last_sync, head_cursor[0], head_cursor[1]))
+
+        if new_jobs:
+            logger.info("History sync %s: %d new jobs in %d pages", printer, new_jobs, pages)
+        return {"ok": ok, "new_jobs": new_jobs, "pages": pages}
+
+def local_history_page(printer: str, limit: int, start: int) -> Optional[Dict[str, Any]]:
+    """
+    Same shape as fetch_history_list_page (newest first), served from the local store.
+    """
+    rows = history_db().execute(
+        "SELECT job_json FROM jobs WHERE printer = ? ORDER BY start_time DESC, job_id DESC LIMIT ? OFFSET ?",
+        (printer, int(limit), int(start)),
+    ).fetchall()
+    return {"jobs": [json.loads(r[0]) for r in rows]}
+
+
+# ---------------------------
+# ✅ Columnar history analytics
+# ---------------------------
+#
+# The whole job store is mirrored in memory as parallel typed arrays (one row per job),
+# loaded from SQLite once and then patched by store_history_jobs. Queries filter and
+# bucket those columns with numpy when available, or a plain loop otherwise.
+
+HISTORY_BUCKETS = ("completed", "cancelled", "error", "other")
+HISTORY_QUERY_GRANULARITIES = ("day", "week", "month")
+HISTORY_QUERY_MAX_BUCKETS = 5000
+
+history_columns_lock = threading.Lock()
+history_columns: Dict[str, Any] = {"loaded": False}
+history_columns_pending: List[tuple] = []
+
+def _empty_history_columns() -> Dict[str, Any]:
+    return {
+        "loaded": False,
+        "printers": [],             # printer id -> hostname
+        "printer_ids": {},          # hostname -> printer id
+        "files": [],                # file id -> filename
+        "file_ids": {},             # filename -> file id
+        "index": {},                # (printer id, job_id) -> row
+        "printer": array("i"),
+        "file": array("i"),
+        "status": array("b"),       # index into HISTORY_BUCKETS
+        "start": array("d"),        # NaN when unknown
+        "day": array("i"),          # local date ordinal of start (bucketing without per-query date math)
+        "end": array("d"),
+        "hours": array("d"),        # print_duration, falling back to total_duration
+        "filament": array("d"),
+    }
+
+def _intern(names: List[str], ids: Dict[str, int], name: str) -> int:
+    i = ids.get(name)
+    if i is None:
+        i = ids[name] = len(names)
+        names.append(name)
+    return i
+
+def _put_history_row(cols: Dict[str, Any], printer: str, job_id: str, status, st, et, td, pd, fil, filename) -> None:
+    pid = _intern(cols["printers"], cols["printer_ids"], printer)
+    fid = _intern(cols["files"], cols["file_ids"], filename or "")
+    dur_s = pd if pd is not None else td
+    try:
+        day = datetime.fromtimestamp(float(st)).toordinal() if st is not None else 0
+    except (OverflowError, OSError, ValueError):
+        day = 0
+    values = (
+        ("printer", pid),
+        ("file", fid),
+        ("status", HISTORY_BUCKETS.index(_bucket_status(status))),
+        ("start", float("nan") if st is None else float(st)),
+        ("day", day),
+        ("end", float("nan") if et is None else float(et)),
+        ("hours", max(float(dur_s or 0.0), 0.0) / 3600.0),
+        ("filament", float(fil or 0.0)),
+    )
+    row = cols["index"].get((pid, job_id))
+    if row is None:
+        # Index the row only once every column holds it; undo a partial append
+        appended = []
+        try:
+            for name, v in values:
+                cols[name].append(v)
+                appended.append(name)
+        except BaseException:
+            for name in appended:
+                cols[name].pop()
+            raise
+        cols["index"][(pid, job_id)] = len(cols["start"]) - 1
+    else:
+        for name, v in values:
+            cols[name][row] = v
+
+def note_history_rows(rows: List[tuple]) -> None:
+    """
+    Queue freshly stored job rows (store_history_jobs tuples) for the in-memory columns.
+    """
+    with history_columns_lock:
+        if history_columns.get("loaded"):
+            history_columns_pending.extend(rows)
+
+def _history_columns_locked() -> Dict[str, Any]:
+    """
+    Load the columns on first use, then fold in pending rows. Caller holds history_columns_lock.
+    """
+    global history_columns
+    if not history_columns.get("loaded"):
+        cols = _empty_history_columns()
+        for r in history_db().execute("""
+            SELECT printer, job_id, status, start_time, end_time, total_duration,
+                   print_duration, filament_used, filename
+            FROM jobs
+        """):
+            _put_history_row(cols, *r)
+        cols["loaded"] = True
+        history_columns = cols
+        history_columns_pending.clear()
+        logger.info("History columns loaded: %d jobs, %d printers", len(cols["start"]), len(cols["printers"]))
+
+    if history_columns_pending:
+        cols = history_columns
+        for r in history_columns_pending:
+            # (printer, job_id, status, start, end, total, print, filament, filename, json)
+            _put_history_row(cols, r[0], r[1], r[2], r[3], r[4], r[5], r[6], r[7], r[8])
+        history_columns_pending.clear()
+    return history_columns
+
+def history_bucket_edges(since: float, until: float, granularity: str) -> List[float]:
+    """
+    Local-time bucket boundaries covering [since, until): midnight, Monday or the 1st.
+    """
+    d = datetime.fromtimestamp(since).replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "week":
+        d -= timedelta(days=d.weekday())
+    elif granularity == "month":
+        d = d.replace(day=1)
+
+    edges: List[float] = []
+    while True:
+        edges.append(d.timestamp())
+        if edges[-1] >= until or len(edges) > HISTORY_QUERY_MAX_BUCKETS:
+            break
+        if granularity == "day":
+            d += timedelta(days=1)
+        elif granularity == "week":
+            d += timedelta(days=7)
+        else:
+            d = d.replace(year=d.year + 1, month=1) if d.month == 12 else d.replace(month=d.month + 1)
+    return edges
+
+def _history_day_lut(edges: List[float], since: float, until: float) -> Tuple[int, List[int]]:
+    """
+    (first ordinal, bucket index per local date from since..until) for the given edges.
+    """
+    first = datetime.fromtimestamp(since).toordinal()
+    last = datetime.fromtimestamp(until).toordinal()
+    lut = [
+        max(bisect.bisect_right(edges, datetime.fromordinal(o).timestamp()) - 1, 0)
+        for o in range(first, last + 1)
+    ]
+    return first, lut
+
+def _history_column(cols: Dict[str, Any], name: str, dtype: Any, n: int, mask: Any = None) -> Any:
+    """Copy of a column as a numpy array (masked rows only, if given). Caller holds history_columns_lock."""
+    view = np.frombuffer(cols[name], dtype=dtype, count=n)
+    return view.copy() if mask is None else view[mask]
+
+def query_history(
+    printers: List[str],
+    since: float,
+    until: float,
+    granularity: str = "month",
+    group_by: Optional[str] = None,
+    limit_groups: int = 50,
+) -> Dict[str, Any]:
+    """
+    Aggregate stored jobs of the given printers that started in [since, until).
+      - buckets: per time bucket jobs / hours / filament / status counts / fleet utilization
+      - groups (group_by "printer" or "file"): totals plus an hours series per bucket
+    Jobs count toward the bucket their start_time falls in. Utilization is print hours
+    over wall-clock hours (times the number of printers for fleet/file figures).
+    """
+    t0 = time.perf_counter()
+    edges = history_bucket_edges(since, until, granularity)
+    until = min(until, edges[-1])  # edges stop early past HISTORY_QUERY_MAX_BUCKETS
+    spans_h = [(min(edges[i + 1], until) - max(edges[i], since)) / 3600.0 for i in range(len(edges) - 1)]
+    nb = len(spans_h)
+    first_day, day_lut = _history_day_lut(edges, since, until)
+
+    grouped = group_by in ("printer", "file")
+    top_n = max(int(limit_groups), 0)
+
+    with history_columns_lock:
+        cols = _history_columns_locked()
+        wanted = [cols["printer_ids"][p] for p in printers if p in cols["printer_ids"]]
+        group_names: List[str] = cols["printers"] if group_by == "printer" else cols["files"] if group_by == "file" else []
+
+        if np is not None:
+            n = len(cols["start"])
+            # Copies only: a buffer view outliving the lock would make the next append raise BufferError
+            start = _history_column(cols, "start", np.float64, n)
+            pid = _history_column(cols, "printer", np.int32, n)
+            allowed = np.zeros(len(cols["printers"]) + 1, dtype=bool)
+            allowed[wanted] = True
+            mask = allowed[pid] & (start >= since) & (start < until)
+            day = _history_column(cols, "day", np.int32, n, mask)
+            hours = _history_column(cols, "hours", np.float64, n, mask)
+            fil = _history_column(cols, "filament", np.float64, n, mask)
+            st = _history_column(cols, "status", np.int8, n, mask).astype(np.int64)
+            if group_by == "printer":
+                g = pid[mask].astype(np.int64)
+            elif group_by == "file":
+                g = _history_column(cols, "file", np.int32, n, mask).astype(np.int64)
+            else:
+                g = None
+        else:
+            rows = []
+            wanted_set = set(wanted)
+            col_pid, col_file, col_start, col_day = cols["printer"], cols["file"], cols["start"], cols["day"]
+            col_hours, col_fil, col_status = cols["hours"], cols["filament"], cols["status"]
+            for i in range(len(col_start)):
+                t = col_start[i]
+                if not (since <= t < until) or col_pid[i] not in wanted_set:
+                    continue
+                gi = col_pid[i] if group_by == "printer" else col_file[i] if group_by == "file" else 0
+                rows.append((col_day[i], gi, col_hours[i], col_fil[i], col_status[i]))
+
+    # Per group: (group id, jobs, hours, filament, hours series), the top_n by hours
+    top: List[Tuple[int, int, float, float, List[float]]] = []
+    if np is not None:
+        b = np.asarray(day_lut, dtype=np.int64)[day - first_day]
+        b_jobs = np.bincount(b, minlength=nb).tolist()
+        b_hours = np.bincount(b, weights=hours, minlength=nb).tolist()
+        b_fil = np.bincount(b, weights=fil, minlength=nb).tolist()
+        b_status = np.bincount(b * len(HISTORY_BUCKETS) + st, minlength=nb * len(HISTORY_BUCKETS)).tolist()
+        if grouped and len(g):
+            # Compact to the groups present, then build series for the top ones only
+            present, gc = np.unique(g, return_inverse=True)
+            gc = gc.reshape(-1)
+            g_jobs = np.bincount(gc, minlength=len(present))
+            g_hours = np.bincount(gc, weights=hours, minlength=len(present))
+            g_fil = np.bincount(gc, weights=fil, minlength=len(present))
+            order = np.argsort(-g_hours, kind="stable")[:top_n]
+            rank = np.full(len(present), -1, dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            r = rank[gc]
+            sel = r >= 0
+            series = np.bincount(r[sel] * nb + b[sel], weights=hours[sel], minlength=len(order) * nb)
+            series = series.reshape(len(order), nb) if nb else None
+            for k, ci in enumerate(order.tolist()):
+                top.append((
+                    int(present[ci]), int(g_jobs[ci]), float(g_hours[ci]), float(g_fil[ci]),
+                    series[k].tolist() if nb else [],
+                ))
+    else:
+        b_jobs = [0] * nb
+        b_hours = [0.0] * nb
+        b_fil = [0.0] * nb
+        b_status = [0] * (nb * len(HISTORY_BUCKETS))
+        g_totals: Dict[int, List[float]] = {}  # group -> [jobs, hours, filament]
+        gb: Dict[Tuple[int, int], float] = {}   # (group, bucket) -> hours; sparse
+        for dy, gi, h, f, stc in rows:
+            bi = day_lut[dy - first_day]
+            b_jobs[bi] += 1
+            b_hours[bi] += h
+            b_fil[bi] += f
+            b_status[bi * len(HISTORY_BUCKETS) + stc] += 1
+            if grouped:
+                tot = g_totals.setdefault(gi, [0, 0.0, 0.0])
+                tot[0] += 1
+                tot[1] += h
+                tot[2] += f
+                gb[(gi, bi)] = gb.get((gi, bi), 0.0) + h
+        for gi in sorted(g_totals, key=lambda k: (-g_totals[k][1], k))[:top_n]:
+            jobs_g, hours_g, fil_g = g_totals[gi]
+            top.append((gi, int(jobs_g), hours_g, fil_g, [gb.get((gi, bi), 0.0) for bi in range(nb)]))
+
+    n_printers = max(len(wanted), 1)
+    total_span_h = sum(spans_h)
+    buckets = []
+    for i in range(nb):
+        buckets.append({
+            "start": _iso_from_ts(edges[i]),
+            "label": _history_bucket_label(edges[i], granularity),
+            "jobs": int(b_jobs[i]),
+            "hours": float(b_hours[i]),
+            "filament_used": float(b_fil[i]),
+            "status": {k: int(b_status[i * len(HISTORY_BUCKETS) + j]) for j, k in enumerate(HISTORY_BUCKETS)},
+            "utilization": (float(b_hours[i]) / (spans_h[i] * n_printers)) if spans_h[i] > 0 else 0.0,
+        })
+
+    groups = []
+    denom = total_span_h * (1 if group_by == "printer" else n_printers)
+    for gi, jobs_g, hours_g, fil_g, series_g in top:
+        groups.append({
+            "key": group_names[gi],
+            "jobs": jobs_g,
+            "hours": hours_g,
+            "filament_used": fil_g,
+            "utilization": hours_g / denom if denom > 0 else 0.0,
+            "series": series_g,
+        })
+
+    total_hours = float(sum(b_hours))
+    return {
+        "since": _iso_from_ts(since),
+        "until": _iso_from_ts(until),
+        "granularity": granularity,
+        "group_by": group_by,
+        "printers": len(wanted),
+        "totals": {
+            "jobs": int(sum(b_jobs)),
+            "hours": total_hours,
+            "filament_used": float(sum(b_fil)),
+            "utilization": total_hours / (total_span_h * n_printers) if total_span_h > 0 else 0.0,
+        },
+        "buckets": buckets,
+        "groups": groups,
+        "engine": "numpy" if np is not None else "python",
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+    }
+
+def _history_bucket_label(ts: float, granularity: str) -> str:
+    d = datetime.fromtimestamp(ts)
+    if granularity == "month":
+        return f"{_MONTH_ABBR[d.month - 1]} {d.year}"
+    return d.strftime("%Y-%m-%d")
+
 def find_job_matching_duration(
     base: str,
     target_seconds: float,
     duration_key: str,
     page_limit: int = 200,
     max_pages: int = 6,
-    eps: float = 0.01
+    eps: float = 0.01,
+    fetch_page: Optional[Callable[[int, int], Optional[Dict[str, Any]]]] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Scan the history list looking for a job whose {duration_key} matches target_seconds.
     duration_key should be "total_duration" or "print_duration".
+    fetch_page(limit, start) overrides where pages come from (e.g. the local store).
     """
-    if not target_seconds or target_seconds <= 0:
-        return None
-
-    start = 0
-    for _ in range(max_pages):
-        page = fetch_history_list_page(base, limit=page_limit, start=start, order="desc")
-        if not page:
-            return None
-        jobs = page.get("jobs") or []
-        if not jobs:
-            return None
-
-        for job in jobs:
-            try:
-                v = float(job.get(duration_key) or 0.0)
-                if abs(v - float(target_seconds)) <= eps:
-                    return job
-            except Exception:
-                continue
-
-        start += page_limit
-
-    return None
+    res = scan_history(
+        base,
+        targets={"match": (duration_key, target_seconds)},
+        page_limit=page_limit,
+        match_pages=max_pages,
+        stats_pages=0,
+        eps=eps,
+        fetch_page=fetch_page,
+    )
+    return res["matches"].get("match")
 
 # ---------------------------
 # NEW: status + monthly rollups
@@ -879,26 +3215,43 @@ def _iso_from_ts(ts: Optional[float]) -> Optional[str]:
     except Exception:
         return None
 
-def scan_history_stats(
+def scan_history(
     base: str,
+    targets: Optional[Dict[str, Tuple[str, float]]] = None,
     page_limit: int = 200,
-    max_pages: int = 12,
+    match_pages: int = 6,
+    stats_pages: int = 12,
+    eps: float = 0.01,
+    fetch_page: Optional[Callable[[int, int], Optional[Dict[str, Any]]]] = None,
 ) -> Dict[str, Any]:
     """
-    Scan /server/history/list and compute:
-      - status_breakdown: counts by bucket
-      - status_time_hours: hours by bucket (based on print_duration with fallback)
-      - by_period: monthly print hours (based on print_duration with fallback)
-      - last_print_finished: newest end_time in iso
+    One pass over /server/history/list (newest first) computing everything the
+    aggregate needs:
+      - matches: for each name -> (duration_key, target_seconds), the first job whose
+        duration matches within eps (searched in the first match_pages pages)
+      - status_breakdown / status_time_hours / by_period / last_print_finished
+        over the first stats_pages pages
+    Paging stops as soon as the stats window is covered and every target is found.
+    fetch_page(limit, start) overrides where pages come from (e.g. the local store).
     """
+    pending: Dict[str, Tuple[str, float]] = {}
+    for name, (key, target) in (targets or {}).items():
+        if target and float(target) > 0:
+            pending[name] = (key, float(target))
+    matches: Dict[str, Optional[Dict[str, Any]]] = {name: None for name in (targets or {})}
+
     counts = {"completed": 0, "cancelled": 0, "error": 0, "other": 0}
     time_hours = {"completed": 0.0, "cancelled": 0.0, "error": 0.0, "other": 0.0}
     by_month: Dict[str, float] = {}
     last_end_ts: float = 0.0
 
+    page_index = 0
     start = 0
-    for _ in range(max_pages):
-        page = fetch_history_list_page(base, limit=page_limit, start=start, order="desc")
+    while page_index < stats_pages or (pending and page_index < match_pages):
+        if fetch_page is not None:
+            page = fetch_page(page_limit, start)
+        else:
+            page = fetch_history_list_page(base, limit=page_limit, start=start, order="desc")
         if not page:
             break
 
@@ -906,7 +3259,21 @@ def scan_history_stats(
         if not jobs:
             break
 
+        check_matches = bool(pending) and page_index < match_pages
+        collect_stats = page_index < stats_pages
+
         for job in jobs:
+            if check_matches:
+                for name, (key, target) in list(pending.items()):
+                    try:
+                        if abs(float(job.get(key) or 0.0) - target) <= eps:
+                            matches[name] = job
+                            del pending[name]
+                    except Exception:
+                        continue
+
+            if not collect_stats:
+                continue
             try:
                 bucket = _bucket_status(job.get("status"))
                 counts[bucket] = int(counts.get(bucket, 0)) + 1
@@ -935,6 +3302,7 @@ def scan_history_stats(
             except Exception:
                 continue
 
+        page_index += 1
         start += page_limit
 
     # Sorted monthly list for frontend
@@ -948,12 +3316,29 @@ def scan_history_stats(
     by_period.sort(key=lambda x: _month_sort_key(x["label"]))
 
     return {
+        "matches": matches,
+        "pages": page_index,
         "status_breakdown": counts,
         "status_time_hours": time_hours,
         "by_period": by_period,
         "last_print_finished": _iso_from_ts(last_end_ts) if last_end_ts else None,
     }
 
+def scan_history_stats(
+    base: str,
+    page_limit: int = 200,
+    max_pages: int = 12,
+    fetch_page: Optional[Callable[[int, int], Optional[Dict[str, Any]]]] = None,
+) -> Dict[str, Any]:
+    """
+    Scan /server/history/list and compute:
+      - status_breakdown: counts by bucket
+      - status_time_hours: hours by bucket (based on print_duration with fallback)
+      - by_period: monthly print hours (based on print_duration with fallback)
+      - last_print_finished: newest end_time in iso
+    """
+    return scan_history(base, page_limit=page_limit, stats_pages=max_pages, fetch_page=fetch_page)
+
 def aggregate_history_for_device(device: Dict[str, Any], opts: Dict[str, Any]) -> Dict[str, Any]:
     base = device.get("base_url")
     out: Dict[str, Any] = {
@@ -977,56 +3362,555 @@ def aggregate_history_for_device(device: Dict[str, Any], opts: Dict[str, Any]) -
         out["error"] = "missing base_url"
         return out
 
-    totals = fetch_history_totals(base)
-    if not totals:
-        out["error"] = "history totals unavailable"
-        return out
+    totals = fetch_history_totals(base)
+    if not totals:
+        out["error"] = "history totals unavailable"
+        return out
+
+    job_totals = totals.get("job_totals") or {}
+    out["job_totals"] = job_totals
+    out["ok"] = True
+
+    match_longest = opts.get("match_longest", True)
+    page_limit = int(opts.get("page_limit", 200))
+    max_pages = int(opts.get("max_pages", 6))
+
+    # Scan the local mirror when it could be synced; otherwise fall back to paging Moonraker.
+    fetch_page = None
+    hostname = device.get("hostname")
+    if hostname:
+        try:
+            sync = sync_printer_history(hostname, base, force=bool(opts.get("force_sync")))
+            out["history_sync"] = sync
+            has_local = history_db().execute(
+                "SELECT 1 FROM jobs WHERE printer = ? LIMIT 1", (hostname,)
+            ).fetchone() is not None
+            if sync.get("ok") or has_local:
+                fetch_page = lambda limit, start: local_history_page(hostname, limit, start)
+        except sqlite3.Error as e:
+            logger.warning("History store unavailable for %s: %s", hostname, e)
+
+    # durations in seconds
+    longest_job_s = float(job_totals.get("longest_job") or 0.0)
+    longest_print_s = float(job_totals.get("longest_print") or 0.0)
+
+    targets: Dict[str, Tuple[str, float]] = {}
+    if match_longest:
+        targets = {
+            "longest_job": ("total_duration", longest_job_s),
+            "longest_print": ("print_duration", longest_print_s),
+        }
+    else:
+        out["longest_job"] = {"total_duration": longest_job_s}
+        out["longest_print"] = {"print_duration": longest_print_s}
+
+    # one pass: longest-job/print matches + breakdowns.
+    # With the local store the breakdowns come from its rollups, bounded to the
+    # same stats_pages * page_limit newest jobs, so the scan only has to find the matches.
+    try:
+        stats_pages = int(opts.get("stats_pages", 12))
+        stats = scan_history(
+            base,
+            targets=targets,
+            page_limit=page_limit,
+            match_pages=max_pages,
+            stats_pages=0 if fetch_page is not None else stats_pages,
+            fetch_page=fetch_page,
+        )
+        if match_longest:
+            out["longest_job"] = stats["matches"].get("longest_job")
+            out["longest_print"] = stats["matches"].get("longest_print")
+        if fetch_page is not None:
+            out["history_source"] = "local"
+            stats = history_rollup([hostname], window_jobs=stats_pages * page_limit)
+        out["status_breakdown"] = stats.get("status_breakdown")
+        out["status_time_hours"] = stats.get("status_time_hours")
+        out["by_period"] = stats.get("by_period")
+        out["last_print_finished"] = stats.get("last_print_finished")
+    except Exception:
+        pass
+
+    return out
+
+# ---------------------------
+# ✅ Fleet command dispatcher
+# ---------------------------
+#
+# One backend call fans a command out to many printers over the pooled Moonraker
+# session, instead of the browser opening a connection per printer. Commands run
+# on their own bounded executors, not the async engine's HTTP pool, so a fleet-wide
+# G28/M109 (up to COMMAND_GCODE_TIMEOUT_S each) can't starve status refreshes.
+# Stop/pause/cancel get a separate pool so they never queue behind long scripts.
+
+COMMAND_TIMEOUT_S = 10.0
+COMMAND_GCODE_TIMEOUT_S = 60.0  # /printer/gcode/script only answers once the script has run
+COMMAND_LOG_SIZE = 200
+
+# command -> (Moonraker endpoint, required argument or None)
+FLEET_COMMANDS: Dict[str, Tuple[str, Optional[str]]] = {
+    "gcode": ("/printer/gcode/script", "script"),
+    "start": ("/printer/print/start", "filename"),
+    "pause": ("/printer/print/pause", None),
+    "resume": ("/printer/print/resume", None),
+    "cancel": ("/printer/print/cancel", None),
+    "emergency_stop": ("/printer/emergency_stop", None),
+    "firmware_restart": ("/printer/firmware_restart", None),
+}
+
+COMMAND_CONCURRENCY = _env_number("HELM_COMMAND_CONCURRENCY", 32)
+URGENT_COMMANDS = frozenset({"emergency_stop", "pause", "cancel"})
+URGENT_COMMAND_CONCURRENCY = 16
+
+command_log_lock = threading.Lock()
+command_log: deque = deque(maxlen=COMMAND_LOG_SIZE)
+
+command_pools_lock = threading.Lock()
+# "normal" | "urgent" -> executor
+command_pools: Dict[str, ThreadPoolExecutor] = {}
+
+def get_command_pool(command: str) -> ThreadPoolExecutor:
+    kind = "urgent" if command in URGENT_COMMANDS else "normal"
+    with command_pools_lock:
+        pool = command_pools.get(kind)
+        if pool is None:
+            workers = URGENT_COMMAND_CONCURRENCY if kind == "urgent" else COMMAND_CONCURRENCY
+            pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"helm-command-{kind}")
+            command_pools[kind] = pool
+        return pool
+
+def resolve_command_targets(
+    targets: List[Any],
+    u: Optional[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Map requested targets (hostname, ip, ip:port or base URL) to registry entries.
+    Returns (resolved entries, per-target error results for unknown/forbidden ones).
+    """
+    allowed = allowed_printer_hostnames_for_user(u)
+    with printer_registry_lock:
+        entries = [dict(e) for e in printer_registry.values()]
+
+    by_key: Dict[str, Dict[str, Any]] = {}
+    for e in entries:
+        base = str(e.get("base_url") or "")
+        netloc = re.sub(r"^https?://", "", base).rstrip("/")
+        for key in (e.get("ip"), netloc, base, e.get("hostname")):  # hostname wins on collisions
+            if key:
+                by_key[str(key)] = e
+
+    resolved: List[Dict[str, Any]] = []
+    rejected: List[Dict[str, Any]] = []
+    seen: set = set()
+    for t in targets:
+        key = str(t or "").strip().rstrip("/")
+        e = by_key.get(key)
+        if e is None:
+            rejected.append({"target": key, "ok": False, "error": "unknown printer"})
+            continue
+        if allowed is not None and e["hostname"] not in allowed:
+            rejected.append({"target": key, "hostname": e["hostname"], "ok": False, "error": "not allowed"})
+            continue
+        if e["hostname"] in seen:
+            continue
+        seen.add(e["hostname"])
+        resolved.append(dict(e, target=key))
+    return resolved, rejected
+
+def send_printer_command(entry: Dict[str, Any], command: str, arg: Optional[str]) -> Dict[str, Any]:
+    """
+    POST one command to one printer. Never raises; the outcome is in the result.
+    """
+    path, arg_name = FLEET_COMMANDS[command]
+    out: Dict[str, Any] = {
+        "target": entry.get("target"),
+        "hostname": entry.get("hostname"),
+        "ip": entry.get("ip"),
+        "ok": False,
+        "status_code": None,
+        "error": None,
+        "latency_ms": None,
+    }
+    timeout = COMMAND_GCODE_TIMEOUT_S if command == "gcode" else COMMAND_TIMEOUT_S
+    t0 = time.perf_counter()
+    try:
+        r = moonraker_request(
+            "POST",
+            f"{entry['base_url']}{path}",
+            timeout=timeout,
+            params={arg_name: arg} if arg_name else None,
+        )
+        out["status_code"] = r.status_code
+        out["ok"] = r.ok
+        if not r.ok:
+            try:
+                err = r.json().get("error")
+                out["error"] = err.get("message") if isinstance(err, dict) else str(err or r.reason)
+            except ValueError:
+                out["error"] = r.text[:200] or r.reason
+    except requests.RequestException as e:
+        out["error"] = str(e)
+    out["latency_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return out
+
+def dispatch_fleet_command(entries: List[Dict[str, Any]], command: str, arg: Optional[str]) -> List[Any]:
+    """
+    Start the fan-out on the command executors; returns one concurrent future per printer.
+    """
+    pool = get_command_pool(command)
+    return [pool.submit(send_printer_command, e, command, arg) for e in entries]
+
+def record_command(u: Optional[Dict[str, Any]], command: str, arg: Optional[str], results: List[Dict[str, Any]], elapsed_ms: float) -> Dict[str, Any]:
+    entry = {
+        "id": secrets.token_hex(6),
+        "ts": time.time(),
+        "user_id": (u or {}).get("id"),
+        "username": (u or {}).get("username") or (u or {}).get("name"),
+        "command": command,
+        "arg": arg,
+        "targets": len(results),
+        "ok": sum(1 for r in results if r.get("ok")),
+        "failed": sum(1 for r in results if not r.get("ok")),
+        "elapsed_ms": round(elapsed_ms, 1),
+        "results": results,
+    }
+    with command_log_lock:
+        command_log.append(entry)
+    logger.info("Command %s by %s: %d ok, %d failed in %.0f ms",
+                command, entry["username"], entry["ok"], entry["failed"], elapsed_ms)
+    return entry
+
+# ---------------------------
+# ✅ Content-addressed gcode store
+# ---------------------------
+#
+# Uploaded files are kept in GCODE_STORE_DIR under their sha256, and every successful
+# push is recorded as (printer, path) -> sha256 + the size/modified Moonraker reported.
+# A later push of the same content is skipped while the printer's file index still
+# shows that size/modified for the path (i.e. nobody replaced the file since).
+
+GCODE_STORE_MAX_BYTES = _env_number("HELM_GCODE_STORE_MAX_BYTES", 20 * 1024 ** 3)
+
+gcode_store_lock = threading.Lock()
+
+def gcode_store_put(spool_path: str, sha256: str) -> str:
+    """
+    Move a spooled upload into the store (or drop it if that content is already there).
+    """
+    os.makedirs(GCODE_STORE_DIR, exist_ok=True)
+    dest = os.path.join(GCODE_STORE_DIR, sha256)
+    with gcode_store_lock:
+        if os.path.isfile(dest):
+            os.remove(spool_path)
+            os.utime(dest)
+        else:
+            os.replace(spool_path, dest)
+    prune_gcode_store(keep={dest})
+    return dest
+
+def prune_gcode_store(keep: set) -> None:
+    """
+    Evict least recently used content once the store outgrows GCODE_STORE_MAX_BYTES,
+    never touching files an upload job still references.
+    """
+    with upload_jobs_lock:
+        in_use = {j["spool_path"] for j in upload_jobs.values()} | set(keep)
+    with gcode_store_lock:
+        try:
+            names = os.listdir(GCODE_STORE_DIR)
+        except OSError:
+            return
+        files = []
+        for name in names:
+            path = os.path.join(GCODE_STORE_DIR, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= GCODE_STORE_MAX_BYTES:
+                break
+            if path in in_use:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
 
-    job_totals = totals.get("job_totals") or {}
-    out["job_totals"] = job_totals
-    out["ok"] = True
+def record_gcode_push(printer: str, path: str, sha256: str, size: Optional[int], modified: Optional[float]) -> None:
+    conn = history_db()
+    with conn:
+        conn.execute("""
+            INSERT INTO gcode_pushes (printer, path, sha256, size, modified, pushed_ts) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (printer, path) DO UPDATE SET
+                sha256 = excluded.sha256, size = excluded.size,
+                modified = excluded.modified, pushed_ts = excluded.pushed_ts
+        """, (printer, path, sha256, size, modified, time.time()))
+
+def printer_has_content(printer: str, path: str, sha256: str, size: int) -> bool:
+    """
+    True when our last push of `path` to `printer` was this content and the printer's
+    file index still shows the same size/modified for it.
+    """
+    with gcode_index_lock:
+        entry = gcode_index.get(printer)
+        meta = dict(entry["files"].get(path) or {}) if entry and not entry.get("error") else None
+    if not meta or meta.get("size") != size:
+        return False
 
-    match_longest = opts.get("match_longest", True)
-    page_limit = int(opts.get("page_limit", 200))
-    max_pages = int(opts.get("max_pages", 6))
+    rec = history_db().execute(
+        "SELECT sha256, size, modified FROM gcode_pushes WHERE printer = ? AND path = ?", (printer, path)
+    ).fetchone()
+    if rec is None or rec[0] != sha256 or rec[1] != size:
+        return False
+    if rec[2] is None:
+        # Moonraker didn't report mtime on upload: adopt the first one we see afterwards
+        record_gcode_push(printer, path, sha256, size, _float_or_none(meta.get("modified")))
+        return True
+    try:
+        return abs(float(meta.get("modified")) - float(rec[2])) < 0.001
+    except (TypeError, ValueError):
+        return False
 
-    # durations in seconds
-    longest_job_s = float(job_totals.get("longest_job") or 0.0)
-    longest_print_s = float(job_totals.get("longest_print") or 0.0)
+# ---------------------------
+# ✅ Fleet upload distribution
+# ---------------------------
+#
+# The browser uploads a file once; it is spooled to UPLOAD_SPOOL_DIR (hashing as it
+# goes), moved into the content store and then streamed to every target's
+# /server/files/upload in parallel. Each transfer reads straight from an mmap of the
+# stored file, so the bytes live once in the page cache no matter how many printers
+# receive them. Failed targets are retried automatically and can be retried again
+# later from the stored copy.
+
+UPLOAD_CONCURRENCY = _env_number("HELM_UPLOAD_CONCURRENCY", 16)
+UPLOAD_CHUNK_BYTES = 1 << 20
+UPLOAD_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY_S = 2.0
+UPLOAD_TIMEOUT_S = 300.0
+UPLOAD_SPOOL_TTL_S = 3600.0
+# Largest request body accepted (Werkzeug answers 413 past it, before buffering it all)
+UPLOAD_MAX_BYTES = _env_number("HELM_UPLOAD_MAX_BYTES", 2 * 1024 ** 3)
+# Extensions Moonraker accepts in the gcodes root
+UPLOAD_EXTENSIONS = (".gcode", ".g", ".gco", ".ufp", ".nc")
+
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES
+
+@app.errorhandler(413)
+def request_too_large(_e):
+    return jsonify({"error": "Request too large", "max_bytes": UPLOAD_MAX_BYTES}), 413
+
+upload_jobs_lock = threading.Lock()
+upload_jobs: Dict[str, Dict[str, Any]] = {}
+_upload_pool: Optional[ThreadPoolExecutor] = None
+
+def get_upload_pool() -> ThreadPoolExecutor:
+    global _upload_pool
+    with upload_jobs_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix="helm-upload")
+        return _upload_pool
+
+class _MultipartFileBody:
+    """
+    multipart/form-data request body whose file part is served as memoryview slices
+    of `data` (an mmap of the spool file). requests/urllib3 stream it via read();
+    __len__ gives them a Content-Length. Progress is reported every
+    UPLOAD_CHUNK_BYTES, not on each of the small blocks http.client pulls.
+    """
 
-    if match_longest:
-        lj = find_job_matching_duration(
-            base=base,
-            target_seconds=longest_job_s,
-            duration_key="total_duration",
-            page_limit=page_limit,
-            max_pages=max_pages,
-        )
-        lp = find_job_matching_duration(
-            base=base,
-            target_seconds=longest_print_s,
-            duration_key="print_duration",
-            page_limit=page_limit,
-            max_pages=max_pages,
-        )
-        out["longest_job"] = lj
-        out["longest_print"] = lp
+    def __init__(self, fields: Dict[str, str], filename: str, data: Any, on_progress: Callable[[int], None]):
+        boundary = secrets.token_hex(16)
+        head = b""
+        for name, value in fields.items():
+            head += (
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n"
+            ).encode("utf-8")
+        quoted = filename.replace("\\", "_").replace('"', "_")
+        head += (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{quoted}\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self._parts = [memoryview(head), memoryview(data), memoryview(tail)]
+        self._len = sum(len(p) for p in self._parts)
+        self._part = 0
+        self._offset = 0
+        self._on_progress = on_progress
+        self._reported = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1) -> Any:
+        while self._part < len(self._parts) and self._offset >= len(self._parts[self._part]):
+            self._part += 1
+            self._offset = 0
+        if self._part >= len(self._parts):
+            return b""
+        part = self._parts[self._part]
+        n = len(part) - self._offset if size is None or size < 0 else min(size, len(part) - self._offset)
+        chunk = part[self._offset:self._offset + n]
+        self._offset += n
+        if self._part == 1 and (self._offset - self._reported >= UPLOAD_CHUNK_BYTES or self._offset == len(part)):
+            self._reported = self._offset
+            self._on_progress(self._offset)
+        return chunk
+
+    def release(self) -> None:
+        for p in self._parts:
+            p.release()
+        self._parts = []
+
+def _uploaded_path(job: Dict[str, Any]) -> str:
+    return f"{job['path']}/{job['filename']}" if job["path"] else job["filename"]
+
+def _upload_job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    targets = [dict(t) for t in job["targets"].values()]
+    states = {t["state"] for t in targets}
+    if states & {"queued", "uploading", "retrying"}:
+        state = "running"
+    elif states <= {"done", "skipped"}:
+        state = "done"
+    elif states & {"done", "skipped"}:
+        state = "partial"
     else:
-        out["longest_job"] = {"total_duration": longest_job_s}
-        out["longest_print"] = {"print_duration": longest_print_s}
+        state = "failed"
+    return {
+        "id": job["id"],
+        "filename": job["filename"],
+        "path": job["path"],
+        "uploaded_path": _uploaded_path(job),
+        "size": job["size"],
+        "sha256": job["sha256"],
+        "created": job["created"],
+        "state": state,
+        "ok": sum(1 for t in targets if t["state"] in ("done", "skipped")),
+        "skipped": sum(1 for t in targets if t["state"] == "skipped"),
+        "failed": sum(1 for t in targets if t["state"] == "failed"),
+        "targets": sorted(targets, key=lambda t: str(t.get("hostname"))),
+    }
+
+def _set_upload_target(job: Dict[str, Any], hostname: str, **fields) -> None:
+    with upload_jobs_lock:
+        job["targets"][hostname].update(fields)
+        job["touched"] = time.time()
 
-    # breakdowns
+def upload_to_printer(job: Dict[str, Any], hostname: str) -> None:
+    """
+    Stream the spooled file to one printer, retrying transient failures.
+    """
+    with upload_jobs_lock:
+        entry = dict(job["entries"][hostname])
+    fields = {"root": "gcodes", "checksum": job["sha256"]}
+    if job["path"]:
+        fields["path"] = job["path"]
+    if job["print"]:
+        fields["print"] = "true"
+
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        _set_upload_target(job, hostname, state="uploading", sent=0, attempts=attempt, error=None)
+        t0 = time.perf_counter()
+        error: Optional[str] = None
+        retryable = True
+        try:
+            with open(job["spool_path"], "rb") as fh:
+                data: Any = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if job["size"] else b""
+                body = _MultipartFileBody(
+                    fields, job["filename"], data,
+                    lambda sent: _set_upload_target(job, hostname, sent=sent),
+                )
+                try:
+                    r = moonraker_request(
+                        "POST", f"{entry['base_url']}/server/files/upload",
+                        timeout=UPLOAD_TIMEOUT_S, data=body, headers={"Content-Type": body.content_type},
+                    )
+                finally:
+                    body.release()
+                    if isinstance(data, mmap.mmap):
+                        data.close()
+            if r.ok:
+                _set_upload_target(
+                    job, hostname, state="done", sent=job["size"],
+                    latency_ms=round((time.perf_counter() - t0) * 1000.0, 1),
+                )
+                try:
+                    j = r.json()
+                    item = j.get("item") or (j.get("result") or {}).get("item") or {}
+                except (ValueError, AttributeError):
+                    item = {}
+                try:
+                    record_gcode_push(
+                        hostname, _uploaded_path(job), job["sha256"],
+                        item.get("size", job["size"]), _float_or_none(item.get("modified")),
+                    )
+                except sqlite3.Error as e:
+                    logger.warning("Could not record push of %s to %s: %s", job["filename"], hostname, e)
+                mark_gcode_index_dirty(hostname)
+                return
+            error = f"HTTP {r.status_code}: {r.text[:200]}"
+            retryable = r.status_code >= 500
+        except (requests.RequestException, OSError, ValueError) as e:
+            error = str(e)
+
+        logger.warning("Upload %s -> %s attempt %d failed: %s", job["filename"], hostname, attempt, error)
+        if not retryable or attempt == UPLOAD_ATTEMPTS:
+            _set_upload_target(job, hostname, state="failed", error=error)
+            return
+        _set_upload_target(job, hostname, state="retrying", error=error)
+        time.sleep(UPLOAD_RETRY_DELAY_S * attempt)
+
+def skip_or_upload(job: Dict[str, Any], hostname: str) -> None:
+    """
+    Skip the transfer when the printer already holds this content (starting the
+    print there if asked), otherwise upload it.
+    """
     try:
-        stats_pages = int(opts.get("stats_pages", 12))
-        stats = scan_history_stats(base, page_limit=page_limit, max_pages=stats_pages)
-        out["status_breakdown"] = stats.get("status_breakdown")
-        out["status_time_hours"] = stats.get("status_time_hours")
-        out["by_period"] = stats.get("by_period")
-        out["last_print_finished"] = stats.get("last_print_finished")
-    except Exception:
-        pass
+        has_it = not job["force"] and printer_has_content(hostname, _uploaded_path(job), job["sha256"], job["size"])
+    except sqlite3.Error:
+        has_it = False
+    if not has_it:
+        upload_to_printer(job, hostname)
+        return
 
-    return out
+    error = None
+    if job["print"]:
+        with upload_jobs_lock:
+            entry = dict(job["entries"][hostname])
+        res = send_printer_command(entry, "start", _uploaded_path(job))
+        error = None if res["ok"] else f"start print: {res['error']}"
+    _set_upload_target(job, hostname, state="failed" if error else "skipped", sent=0, error=error)
+
+def start_upload_targets(job: Dict[str, Any], hostnames: List[str]) -> List[Any]:
+    pool = get_upload_pool()
+    for h in hostnames:
+        _set_upload_target(job, h, state="queued", sent=0, error=None)
+    return [pool.submit(skip_or_upload, job, h) for h in hostnames]
+
+def prune_upload_jobs() -> None:
+    """
+    Forget finished jobs once idle for UPLOAD_SPOOL_TTL_S (their content stays in the store).
+    """
+    cutoff = time.time() - UPLOAD_SPOOL_TTL_S
+    with upload_jobs_lock:
+        expired = [
+            j for j in upload_jobs.values()
+            if j["touched"] < cutoff
+            and all(t["state"] in ("done", "skipped", "failed") for t in j["targets"].values())
+        ]
+        for j in expired:
+            upload_jobs.pop(j["id"], None)
 
 # ---------------------------
 # Routes: Auth
@@ -1176,6 +4060,8 @@ def api_health():
         "configured": is_configured(),
         "time": datetime.now().isoformat(),
         "snapshot": HEALTH_SNAPSHOT,
+        "moonraker_http": moonraker_pool_stats(),
+        "poll_schedule": poll_schedule_stats(),
     })
 
 # ---------------------------
@@ -1381,12 +4267,196 @@ def auth_autologin():
 # Routes: Devices (filtered)
 # ---------------------------
 
+# ---------------------------
+# ✅ Encoded device views (ETag / 304)
+# ---------------------------
+#
+# Dashboards poll /api/devices about once a second and the answer rarely
+# changes between polls. Each filtered view is encoded once (plus a gzip copy
+# on first request) and tagged with a hash of its body, so unchanged polls get
+# a 304 even across snapshot refreshes.
+
+ENCODED_VIEW_LIMIT = 32
+DEVICE_GZIP_MIN_BYTES = 1024
+
+encoded_views_lock = threading.Lock()
+# id(view) -> {"view", "body", "etag", "gzip"}
+encoded_views: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+def encoded_device_view(view: Any) -> Dict[str, Any]:
+    """Pre-encoded JSON body and ETag for a device view, memoized per view object."""
+    memo = isinstance(view, tuple)
+    if memo:
+        with encoded_views_lock:
+            entry = encoded_views.get(id(view))
+            if entry is not None and entry["view"] is view:
+                encoded_views.move_to_end(id(view))
+                return entry
+
+    body = json.dumps(list(view), separators=(",", ":"), sort_keys=True, default=_json_default).encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+    entry = {"view": view, "body": body, "etag": etag, "gzip": None}
+    if not memo:
+        return entry
+
+    with encoded_views_lock:
+        for other in encoded_views.values():
+            if other["etag"] == etag and other["gzip"] is not None:
+                entry["gzip"] = other["gzip"]
+                break
+        encoded_views[id(view)] = entry
+        while len(encoded_views) > ENCODED_VIEW_LIMIT:
+            encoded_views.popitem(last=False)
+    return entry
+
+def _etag_matches(etag: str) -> bool:
+    return etag in [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]
+
+def device_view_response(view: Any) -> Response:
+    entry = encoded_device_view(view)
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(entry["etag"]):
+        return Response(status=304, headers=headers)
+
+    body = entry["body"]
+    if len(body) >= DEVICE_GZIP_MIN_BYTES and "gzip" in request.accept_encodings:
+        if entry["gzip"] is None:
+            entry["gzip"] = gzip.compress(body, compresslevel=5)
+        body = entry["gzip"]
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+# ---------------------------
+# ✅ Versioned device state (delta polling)
+# ---------------------------
+#
+# Every field of every printer carries the version at which it last changed,
+# per (cidr, ports) scope. /api/devices?since=<version> then returns only the
+# fields that moved since then, in the same shape as the stream's `delta`
+# events. Versions start at boot time in ms, so a client holding a version
+# from before a restart falls below the horizon and gets a full answer.
+
+DEVICE_TOMBSTONE_LIMIT = 512
+
+device_tables_lock = threading.Lock()
+device_version_state = {"version": int(APP_STARTED_TS * 1000)}
+# scope -> {"snapshot", "version", "horizon", "rows": {hostname: {"row", "fields"}}, "removed": {hostname: version}}
+device_tables: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+
+def note_device_snapshot(scope: Tuple[Any, ...], snapshot: Tuple[Mapping[str, Any], ...]) -> Dict[str, Any]:
+    """Fold a snapshot into the scope's versioned table; a no-op for one already seen."""
+    with device_tables_lock:
+        table = device_tables.get(scope)
+        if table is None:
+            v0 = device_version_state["version"]
+            table = {"snapshot": None, "version": v0, "horizon": v0, "rows": {}, "removed": {}}
+            device_tables[scope] = table
+        if table["snapshot"] is snapshot:
+            return table
+        table["snapshot"] = snapshot
+
+        bumped: List[int] = []
+
+        def bump() -> int:
+            if not bumped:
+                device_version_state["version"] += 1
+                bumped.append(device_version_state["version"])
+            return bumped[0]
+
+        rows = table["rows"]
+        cur = {str(d.get("hostname") or ""): d for d in snapshot}
+        for hn, d in cur.items():
+            ent = rows.get(hn)
+            if ent is None:
+                v = bump()
+                rows[hn] = {"row": dict(d), "fields": {k: v for k in d}}
+                table["removed"].pop(hn, None)
+                continue
+            row, fields = ent["row"], ent["fields"]
+            for k, val in d.items():
+                if k not in row or row[k] != val:
+                    row[k] = val
+                    fields[k] = bump()
+            for k in row:
+                if k not in d and row[k] is not None:
+                    row[k] = None
+                    fields[k] = bump()
+
+        for hn in [hn for hn in rows if hn not in cur]:
+            del rows[hn]
+            table["removed"][hn] = bump()
+        if len(table["removed"]) > DEVICE_TOMBSTONE_LIMIT:
+            oldest = sorted(table["removed"].items(), key=lambda kv: kv[1])
+            for hn, v in oldest[: len(oldest) - DEVICE_TOMBSTONE_LIMIT]:
+                del table["removed"][hn]
+                table["horizon"] = max(table["horizon"], v)
+
+        if bumped:
+            table["version"] = bumped[0]
+        return table
+
+device_acl_tags: "OrderedDict[Optional[frozenset], str]" = OrderedDict()
+
+def device_acl_tag(allowed: Optional[frozenset]) -> str:
+    """Short, stable tag of a permission set (None = every printer)."""
+    with device_tables_lock:
+        tag = device_acl_tags.get(allowed)
+        if tag is not None:
+            device_acl_tags.move_to_end(allowed)
+            return tag
+    if allowed is None:
+        tag = "all"
+    else:
+        tag = hashlib.blake2b("\n".join(sorted(allowed)).encode("utf-8"), digest_size=8).hexdigest()
+    with device_tables_lock:
+        device_acl_tags[allowed] = tag
+        while len(device_acl_tags) > 256:
+            device_acl_tags.popitem(last=False)
+    return tag
+
+def device_delta(
+    table: Dict[str, Any],
+    since: int,
+    allowed: Optional[frozenset],
+    acl: str = "",
+) -> Dict[str, Any]:
+    """
+    Changes after `since` visible to a permission set:
+      {"version", "acl", "full", "changed": {hostname: {field: value}}, "removed": [hostname]}
+    `full` means `since` was unknown or too old, or was issued under another
+    permission set (`acl` differs), and `changed` holds whole rows.
+    """
+    tag = device_acl_tag(allowed)
+    with device_tables_lock:
+        version = table["version"]
+        full = since <= 0 or since < table["horizon"] or since > version or acl != tag
+        changed: Dict[str, Dict[str, Any]] = {}
+        for hn, ent in table["rows"].items():
+            if allowed is not None and hn not in allowed:
+                continue
+            if full:
+                changed[hn] = dict(ent["row"])
+                continue
+            fields = {k: ent["row"][k] for k, v in ent["fields"].items() if v > since}
+            if fields:
+                changed[hn] = fields
+        removed = [] if full else [
+            hn for hn, v in table["removed"].items() if v > since and (allowed is None or hn in allowed)
+        ]
+    return {"version": version, "acl": tag, "full": full, "changed": changed, "removed": removed}
+
 @app.route("/api/devices", methods=["GET"])
 @require_auth
 def get_devices_api():
-    cidr = request.args.get("cidr", "192.168.1.0/24")
-    logger.info(f"[/api/devices] Request args: {dict(request.args)}")
-    logger.info(f"[/api/devices] Using CIDR: {cidr}")
+    """
+    Device list for the caller's printers.
+    With ?since=<version>&acl=<tag> (both from the last answer; since=0 for the
+    first call) returns a delta instead; see device_delta.
+    """
+    cidr = normalize_scan_cidr(request.args.get("cidr", DEFAULT_SCAN_CIDR))
+    if cidr is None:
+        return jsonify(SCAN_CIDR_ERROR), 400
+    logger.debug("[/api/devices] args=%s", dict(request.args))
     
     warm = request.args.get("warm", "0") != "0"
     force = request.args.get("force", "0") == "1"
@@ -1399,7 +4469,7 @@ def get_devices_api():
         except ValueError:
             return jsonify({"error": "Invalid ports param. Use e.g. ?ports=7125,80,4408"}), 400
 
-    devices_list = discover_devices(
+    devices_list = get_registered_devices(
         cidr=cidr,
         warm=warm,
         ports=ports,
@@ -1407,34 +4477,83 @@ def get_devices_api():
         force=force,
     )
     u = current_user()
+    if "since" in request.args:
+        try:
+            since = int(request.args.get("since") or 0)
+        except ValueError:
+            return jsonify({"error": "Invalid since param; pass the version from the last answer"}), 400
+        table = note_device_snapshot((str(cidr), tuple(sorted(ports))), devices_list)
+        acl = request.args.get("acl", "")
+        return jsonify(device_delta(table, since, allowed_printer_hostnames_for_user(u), acl))
+
     devices_list = filter_devices_for_user(devices_list, u)
-    return jsonify(devices_list)
+    return device_view_response(devices_list)
 
 # ---------------------------
-# ✅ NEW: Routes: Fleet gcode list (filtered)
+# ✅ NEW: Routes: Device stream (Server-Sent Events)
 # ---------------------------
 
-@app.route("/api/gcodes", methods=["GET"])
+DEVICE_STREAM_INTERVAL_S = 0.5
+DEVICE_STREAM_KEEPALIVE_S = 15.0
+# Each open stream pins a server thread for as long as the tab stays open, so
+# streams are capped; clients turned away fall back to polling /api/devices.
+DEVICE_STREAM_LIMIT = max(0, _env_number("HELM_MAX_STREAMS", 16))
+
+device_streams_lock = threading.Lock()
+device_streams_open = {"n": 0}
+
+def _acquire_device_stream() -> bool:
+    with device_streams_lock:
+        if device_streams_open["n"] >= DEVICE_STREAM_LIMIT:
+            return False
+        device_streams_open["n"] += 1
+        return True
+
+def _release_device_stream() -> None:
+    with device_streams_lock:
+        device_streams_open["n"] = max(0, device_streams_open["n"] - 1)
+
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=_json_default)}\n\n"
+
+def diff_device_maps(
+    prev: Dict[str, Dict[str, Any]],
+    cur: Dict[str, Dict[str, Any]],
+) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    """
+    Per-printer field deltas between two {hostname: device} maps.
+    New printers are sent whole; removed printers are listed by hostname.
+    """
+    changed: Dict[str, Dict[str, Any]] = {}
+    for hn, d in cur.items():
+        old = prev.get(hn)
+        if old is None:
+            changed[hn] = dict(d)
+            continue
+        fields = {k: v for k, v in d.items() if old.get(k) != v or k not in old}
+        if fields:
+            changed[hn] = fields
+    removed = [hn for hn in prev if hn not in cur]
+    return changed, removed
+
+@app.route("/api/devices/stream", methods=["GET"])
 @require_auth
-def api_gcodes():
+def devices_stream():
     """
-    Return a unique, sorted list of gcode file paths across all discovered printers
-    visible to the current user.
+    Push alternative to polling /api/devices.
+    Sends one `snapshot` event (same list /api/devices returns), then `delta`
+    events: { "changed": {hostname: {field: value}}, "removed": [hostname] }.
 
-    Query params mirror /api/devices:
-      ?cidr=192.168.1.0/24
-    ?warm=0
-      ?ports=7125,80,4408
+    Query params mirror /api/devices (cidr, warm, ports).
+    At most DEVICE_STREAM_LIMIT streams are open at once; beyond that the
+    request gets a 503 and the client should poll /api/devices instead.
     """
-    logger.info(f"[/api/gcodes] Request args: {dict(request.args)}")
-    
-    cidr = request.args.get("cidr", "192.168.1.0/24")
+    cidr = normalize_scan_cidr(request.args.get("cidr", DEFAULT_SCAN_CIDR))
+    if cidr is None:
+        return jsonify(SCAN_CIDR_ERROR), 400
     warm = request.args.get("warm", "0") != "0"
     ports_arg = request.args.get("ports", "")
     ports = [7125, 80, 4408]
-    
-    logger.info(f"[/api/gcodes] Raw cidr from request: '{cidr}'")
-    logger.info(f"[/api/gcodes] Type of cidr: {type(cidr)}")
 
     if ports_arg.strip():
         try:
@@ -1442,57 +4561,387 @@ def api_gcodes():
         except ValueError:
             return jsonify({"error": "Invalid ports param. Use e.g. ?ports=7125,80,4408"}), 400
 
-    logger.info(f"[/api/gcodes] Discovering devices on CIDR: {cidr}, warm: {warm}, ports: {ports}")
-    devices = discover_devices(cidr=cidr, warm=warm, ports=ports)
-    logger.info(f"[/api/gcodes] Found {len(devices)} total devices")
-    
-    u = current_user()
-    logger.info(f"[/api/gcodes] Current user: {u.get('id') if u else 'None'}")
-    
-    devices = filter_devices_for_user(devices, u)
-    logger.info(f"[/api/gcodes] After user filter: {len(devices)} devices")
-    
-    for i, d in enumerate(devices):
-        logger.info(f"[/api/gcodes] Device {i}: {d.get('hostname')} ({d.get('ip')}) -> {d.get('base_url')}")
+    user_id = str(current_user().get("id") or "")
+    # Waitress (with request lookahead) reports a closed socket before the next write
+    client_gone = request.environ.get("waitress.client_disconnected")
 
-    all_files: set = set()
-    lock = threading.Lock()
-    threads: List[threading.Thread] = []
+    if not _acquire_device_stream():
+        resp = jsonify({"error": "too_many_streams", "fallback": "/api/devices"})
+        resp.headers["Retry-After"] = "30"
+        return resp, 503
 
-    def worker(dev: Dict[str, Any]):
-        base = dev.get("base_url")
-        if not base:
-            logger.warning(f"[/api/gcodes] Device {dev.get('hostname')} has no base_url")
-            return
-        logger.info(f"[/api/gcodes] Fetching gcodes from {base}")
-        files = fetch_gcodes_for_printer(base)
-        logger.info(f"[/api/gcodes] Got {len(files) if files else 0} files from {base}: {files}")
-        if not files:
-            return
-        with lock:
-            for p in files:
-                all_files.add(p)
+    def generate():
+        prev: Optional[Dict[str, Dict[str, Any]]] = None
+        last_sent = time.time()
+        while True:
+            if client_gone is not None and client_gone():
+                return
+            # Re-read the user each tick so permission changes (or deletion) apply live
+            u = find_user_by_id(user_id)
+            if not u:
+                yield _sse_event("end", {"reason": "unauthorized"})
+                return
 
-    for d in devices:
-        t = threading.Thread(target=worker, args=(d,))
-        t.start()
-        threads.append(t)
+            try:
+                devices = get_registered_devices(cidr=cidr, warm=warm, ports=ports)
+            except Exception as e:
+                logger.info("Device stream refresh failed: %s", e)
+                time.sleep(DEVICE_STREAM_INTERVAL_S)
+                continue
 
-    for t in threads:
-        t.join()
+            visible = filter_devices_for_user(devices, u)
+            cur = {str(d.get("hostname") or ""): d for d in visible}
+
+            if prev is None:
+                yield _sse_event("snapshot", visible)
+                last_sent = time.time()
+            else:
+                changed, removed = diff_device_maps(prev, cur)
+                if changed or removed:
+                    yield _sse_event("delta", {"changed": changed, "removed": removed})
+                    last_sent = time.time()
+                elif time.time() - last_sent >= DEVICE_STREAM_KEEPALIVE_S:
+                    yield ": keepalive\n\n"
+                    last_sent = time.time()
+
+            prev = cur
+            time.sleep(DEVICE_STREAM_INTERVAL_S)
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.call_on_close(_release_device_stream)
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# ---------------------------
+# ✅ NEW: Routes: Fleet gcode list (filtered)
+# ---------------------------
+
+def _gcode_route_devices() -> Tuple[List[Dict[str, Any]], Any]:
+    """
+    (registered printers visible to the current user, error response or None);
+    query params mirror /api/devices.
+    """
+    cidr = normalize_scan_cidr(request.args.get("cidr", DEFAULT_SCAN_CIDR))
+    if cidr is None:
+        return [], (jsonify(SCAN_CIDR_ERROR), 400)
+    warm = request.args.get("warm", "0") != "0"
+    ports_arg = request.args.get("ports", "")
+    ports = [7125, 80, 4408]
+
+    if ports_arg.strip():
+        try:
+            ports = [int(p.strip()) for p in ports_arg.split(",") if p.strip()]
+        except ValueError:
+            return [], (jsonify({"error": "Invalid ports param. Use e.g. ?ports=7125,80,4408"}), 400)
+
+    devices = get_registered_devices(cidr=cidr, warm=warm, ports=ports)
+    devices = filter_devices_for_user(devices, current_user())
+    refresh_gcode_index(devices, force=request.args.get("refresh", "0") != "0")
+    logger.debug("[gcodes] cidr=%s ports=%s -> %d devices", cidr, ports, len(devices))
+    return devices, None
+
+@app.route("/api/gcodes", methods=["GET"])
+@require_auth
+def api_gcodes():
+    """
+    Return a unique, sorted list of gcode file paths across all discovered printers
+    visible to the current user, answered from the fleet gcode index.
+
+    Query params mirror /api/devices:
+      ?cidr=192.168.1.0/24
+      ?warm=0
+      ?ports=7125,80,4408
+      ?refresh=1          (relist every printer instead of trusting the index)
+    """
+    devices, err = _gcode_route_devices()
+    if err:
+        return err
 
-    items = sorted(all_files, key=lambda s: str(s).lower())
-    logger.info(f"[/api/gcodes] Returning {len(items)} unique gcode files")
+    items = gcode_index_files(devices)
+    logger.debug("[/api/gcodes] Returning %d unique gcode files", len(items))
     return jsonify({"count": len(items), "files": items})
 
+@app.route("/api/gcodes/locations", methods=["GET"])
+@require_auth
+def api_gcode_locations():
+    """
+    Which visible printers have a given file:
+      ?file=folder/part.gcode   (path relative to the gcodes root)
+    """
+    path = (request.args.get("file") or "").strip().lstrip("/")
+    if not path:
+        return jsonify({"error": "Missing file param"}), 400
+
+    devices, err = _gcode_route_devices()
+    if err:
+        return err
+
+    printers = gcode_index_locations(devices, path)
+    return jsonify({"file": path, "count": len(printers), "printers": printers})
+
+@app.route("/api/thumbnails/<hostname>/<path:file_path>", methods=["GET"])
+@require_auth
+def api_thumbnail(hostname: str, file_path: str):
+    """
+    Cached gcode thumbnail (PNG). ?size=small for the smallest variant.
+    Usable from <img src>: the browser sends the helm_session cookie.
+    """
+    allowed = allowed_printer_hostnames_for_user(current_user())
+    if allowed is not None and hostname not in allowed:
+        return jsonify({"error": "forbidden"}), 403
+    with printer_registry_lock:
+        dev = dict(printer_registry.get(hostname) or {})
+    if not dev.get("base_url"):
+        return jsonify({"error": "Unknown printer"}), 404
+
+    variant = "small" if request.args.get("size") == "small" else "large"
+    data, key = get_thumbnail(dev, file_path, variant)
+    if data is None:
+        return jsonify({"error": "No thumbnail"}), 404
+
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={THUMB_MAX_AGE_S}"}
+    if _etag_matches(etag):
+        return Response(status=304, headers=headers)
+    return Response(data, mimetype="image/png", headers=headers)
+
+@app.route("/api/commands", methods=["POST"])
+@require_auth
+def api_commands_send():
+    """
+    Fan a command out to printers:
+      {"targets": ["hostname" | "ip" | "ip:port", ...],
+       "command": "gcode" | "start" | "pause" | "resume" | "cancel" | "emergency_stop" | "firmware_restart",
+       "script": "G28"           (gcode)
+       "filename": "part.gcode"  (start)
+       "stream": false}          (true / ?stream=1: SSE `result` per printer, then `done`)
+    """
+    body = request.get_json(silent=True) or {}
+    command = str(body.get("command") or "").strip().lower()
+    if command not in FLEET_COMMANDS:
+        return jsonify({"error": f"Unknown command. Use one of: {', '.join(FLEET_COMMANDS)}"}), 400
+    arg_name = FLEET_COMMANDS[command][1]
+    arg = str(body.get(arg_name) or "").strip() if arg_name else None
+    if arg_name and not arg:
+        return jsonify({"error": f"Missing {arg_name}"}), 400
+    targets = body.get("targets")
+    if not isinstance(targets, list) or not targets:
+        return jsonify({"error": "targets must be a non-empty list"}), 400
+
+    u = current_user()
+    entries, rejected = resolve_command_targets(targets, u)
+    t0 = time.perf_counter()
+    futures = dispatch_fleet_command(entries, command, arg)
+
+    if not (body.get("stream") or request.args.get("stream", "0") != "0"):
+        results = rejected + [f.result() for f in futures]
+        entry = record_command(u, command, arg, results, (time.perf_counter() - t0) * 1000.0)
+        return jsonify(entry)
+
+    def gen():
+        results = list(rejected)
+        for r in rejected:
+            yield _sse_event("result", r)
+        for f in as_completed(futures):
+            r = f.result()
+            results.append(r)
+            yield _sse_event("result", r)
+        entry = record_command(u, command, arg, results, (time.perf_counter() - t0) * 1000.0)
+        yield _sse_event("done", {k: v for k, v in entry.items() if k != "results"})
+
+    resp = Response(gen(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+@app.route("/api/commands", methods=["GET"])
+@require_auth
+def api_commands_log():
+    """
+    Recent fleet commands (newest first). Admins see everyone's, users their own.
+      ?limit=50
+    """
+    try:
+        limit = max(1, min(int(request.args.get("limit", "50") or 50), COMMAND_LOG_SIZE))
+    except ValueError:
+        return jsonify({"error": "Invalid limit param"}), 400
+    u = current_user()
+    with command_log_lock:
+        items = list(command_log)
+    if (u or {}).get("role") != "admin":
+        items = [e for e in items if e.get("user_id") == (u or {}).get("id")]
+    items = items[::-1][:limit]
+    return jsonify({"count": len(items), "commands": items})
+
+def _upload_targets_from_form() -> List[str]:
+    raw = request.form.getlist("targets")
+    if len(raw) == 1 and raw[0].strip().startswith("["):
+        try:
+            parsed = json.loads(raw[0])
+            return [str(x) for x in parsed] if isinstance(parsed, list) else []
+        except ValueError:
+            return []
+    return [x for x in raw if x.strip()]
+
+@app.route("/api/uploads", methods=["POST"])
+@require_auth
+def api_uploads_create():
+    """
+    Upload a gcode file once and distribute it to printers (multipart form):
+      file      the gcode file
+      targets   JSON list (or repeated field) of hostname / ip / ip:port
+      path      optional sub-directory under the gcodes root
+      print     "true" to start printing after the upload
+      force     "true" to push even to printers that already hold identical content
+    Returns 202 with the job (poll GET /api/uploads/<id>); ?wait=1 blocks until done.
+    """
+    if request.content_length is not None and request.content_length > UPLOAD_MAX_BYTES:
+        return request_too_large(None)
+    f = request.files.get("file")
+    if f is None or not f.filename:
+        return jsonify({"error": "Missing file"}), 400
+    if not f.filename.lower().endswith(UPLOAD_EXTENSIONS):
+        return jsonify({"error": "Not a gcode file", "allowed": list(UPLOAD_EXTENSIONS)}), 400
+    targets = _upload_targets_from_form()
+    if not targets:
+        return jsonify({"error": "targets must be a non-empty list"}), 400
+
+    u = current_user()
+    entries, rejected = resolve_command_targets(targets, u)
+    if not entries:
+        return jsonify({"error": "No allowed printers in targets", "rejected": rejected}), 400
+
+    prune_upload_jobs()
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    job_id = secrets.token_hex(8)
+    spool_path = os.path.join(UPLOAD_SPOOL_DIR, job_id + ".part")
+    digest = hashlib.sha256()
+    size = 0
+    with open(spool_path, "wb") as out:
+        while True:
+            chunk = f.stream.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+
+    sha256 = digest.hexdigest()
+    spool_path = gcode_store_put(spool_path, sha256)
+
+    # Current listings for the skip check (cheap when the index is fresh/live)
+    force = (request.form.get("force") or "").strip().lower() == "true"
+    if not force:
+        refresh_gcode_index(entries)
+
+    filename = os.path.basename(f.filename.replace("\\", "/"))
+    job = {
+        "id": job_id,
+        "user_id": (u or {}).get("id"),
+        "filename": filename,
+        "path": (request.form.get("path") or "").strip().strip("/"),
+        "print": (request.form.get("print") or "").strip().lower() == "true",
+        "size": size,
+        "sha256": sha256,
+        "force": force,
+        "spool_path": spool_path,
+        "created": time.time(),
+        "touched": time.time(),
+        "entries": {e["hostname"]: e for e in entries},
+        "targets": {
+            e["hostname"]: {
+                "hostname": e["hostname"], "ip": e.get("ip"), "target": e.get("target"),
+                "state": "queued", "sent": 0, "size": size, "attempts": 0, "error": None, "latency_ms": None,
+            }
+            for e in entries
+        },
+    }
+    with upload_jobs_lock:
+        upload_jobs[job_id] = job
+    logger.info("Upload %s (%d bytes) -> %d printers", filename, size, len(entries))
+
+    futures = start_upload_targets(job, list(job["targets"]))
+    if request.args.get("wait", "0") != "0":
+        for fut in futures:
+            fut.result()
+
+    with upload_jobs_lock:
+        view = _upload_job_view(job)
+    view["rejected"] = rejected
+    return jsonify(view), (200 if request.args.get("wait", "0") != "0" else 202)
+
+def _upload_job_for_user(job_id: str) -> Optional[Dict[str, Any]]:
+    u = current_user() or {}
+    with upload_jobs_lock:
+        job = upload_jobs.get(job_id)
+    if job is None or (u.get("role") != "admin" and job["user_id"] != u.get("id")):
+        return None
+    return job
+
+@app.route("/api/uploads/<job_id>", methods=["GET"])
+@require_auth
+def api_uploads_get(job_id: str):
+    job = _upload_job_for_user(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    with upload_jobs_lock:
+        return jsonify(_upload_job_view(job))
+
+@app.route("/api/uploads/<job_id>/retry", methods=["POST"])
+@require_auth
+def api_uploads_retry(job_id: str):
+    """
+    Re-send the spooled file to the targets that failed.
+    """
+    job = _upload_job_for_user(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown upload"}), 404
+    if not os.path.isfile(job["spool_path"]):
+        return jsonify({"error": "Stored content was evicted; upload the file again"}), 410
+    with upload_jobs_lock:
+        failed = [h for h, t in job["targets"].items() if t["state"] == "failed"]
+    start_upload_targets(job, failed)
+    with upload_jobs_lock:
+        return jsonify(_upload_job_view(job)), 202
+
 # ---------------------------
 # Routes: History aggregate (filtered)
 # ---------------------------
 
+def _merge_fleet_longest(
+    r: Dict[str, Any],
+    jt: Dict[str, Any],
+    best_job: Dict[str, Any],
+    best_print: Dict[str, Any],
+) -> None:
+    """
+    Keep best_job/best_print (updated in place) pointing at the fleet's longest job/print.
+    """
+    for best, total_key in ((best_job, "longest_job"), (best_print, "longest_print")):
+        try:
+            secs = float(jt.get(total_key) or 0.0)
+            if secs > best["seconds"]:
+                best.update({
+                    "seconds": secs,
+                    "printer": r.get("hostname") or r.get("ip"),
+                    "job": r.get(total_key),
+                })
+        except Exception:
+            pass
+
 @app.route("/api/history/aggregate", methods=["GET"])
 @require_auth
 def history_aggregate():
-    cidr = request.args.get("cidr", "192.168.1.0/24")
+    """
+    Fleet history analytics.
+      ?match_longest=1   find the jobs behind longest_job/longest_print (within max_pages pages)
+      ?stats_pages=12    breakdowns cover each printer's newest stats_pages * page_limit jobs
+      ?page_limit=200
+    """
+    cidr = normalize_scan_cidr(request.args.get("cidr", DEFAULT_SCAN_CIDR))
+    if cidr is None:
+        return jsonify(SCAN_CIDR_ERROR), 400
     warm = request.args.get("warm", "0") != "0"
     ports_arg = request.args.get("ports", "")
     ports = [7125, 80, 4408]
@@ -1507,7 +4956,7 @@ def history_aggregate():
     page_limit = int(request.args.get("page_limit", "200"))
     stats_pages = int(request.args.get("stats_pages", "12"))
 
-    devices = discover_devices(cidr=cidr, warm=warm, ports=ports)
+    devices = get_registered_devices(cidr=cidr, warm=warm, ports=ports)
     u = current_user()
     devices = filter_devices_for_user(devices, u)
 
@@ -1555,8 +5004,18 @@ def history_aggregate():
     best_job = {"seconds": 0.0, "printer": None, "job": None}
     best_print = {"seconds": 0.0, "printer": None, "job": None}
 
-    fleet_by_month: Dict[str, float] = {}
+    # Printers served from the local store: read their breakdowns from the rollups in one query.
+    local_printers = [r["hostname"] for r in per_printer if r.get("history_source") == "local"]
+    rolled = history_rollup(local_printers, window_jobs=stats_pages * page_limit) if local_printers else None
+
+    fleet_by_month: Dict[str, float] = {}  # "YYYY-MM" -> hours
     fleet_last_end_ts: float = 0.0
+    if rolled:
+        fleet["status_breakdown"] = rolled["status_breakdown"]
+        fleet["status_time_hours"] = rolled["status_time_hours"]
+        fleet_by_month.update(rolled["by_month"])
+        if rolled["last_print_finished"]:
+            fleet_last_end_ts = datetime.fromisoformat(rolled["last_print_finished"]).timestamp()
 
     for r in per_printer:
         jt = r.get("job_totals") or {}
@@ -1568,6 +5027,10 @@ def history_aggregate():
         except Exception:
             pass
 
+        if r.get("history_source") == "local":
+            _merge_fleet_longest(r, jt, best_job, best_print)
+            continue
+
         sb = r.get("status_breakdown") or {}
         sth = r.get("status_time_hours") or {}
         for k in ("completed", "cancelled", "error", "other"):
@@ -1583,10 +5046,10 @@ def history_aggregate():
         periods = r.get("by_period") or []
         for p in periods:
             try:
-                lbl = str(p.get("label") or "").strip()
+                key = _month_key_from_label(str(p.get("label") or "").strip())
                 hrs = float(p.get("hours") or 0.0)
-                if lbl:
-                    fleet_by_month[lbl] = float(fleet_by_month.get(lbl, 0.0)) + hrs
+                if key:
+                    fleet_by_month[key] = float(fleet_by_month.get(key, 0.0)) + hrs
             except Exception:
                 continue
 
@@ -1599,42 +5062,18 @@ def history_aggregate():
             except Exception:
                 pass
 
-        try:
-            lj_s = float(jt.get("longest_job") or 0.0)
-            if lj_s > best_job["seconds"]:
-                best_job = {
-                    "seconds": lj_s,
-                    "printer": r.get("hostname") or r.get("ip"),
-                    "job": r.get("longest_job"),
-                }
-        except Exception:
-            pass
-
-        try:
-            lp_s = float(jt.get("longest_print") or 0.0)
-            if lp_s > best_print["seconds"]:
-                best_print = {
-                    "seconds": lp_s,
-                    "printer": r.get("hostname") or r.get("ip"),
-                    "job": r.get("longest_print"),
-                }
-        except Exception:
-            pass
+        _merge_fleet_longest(r, jt, best_job, best_print)
 
     if best_job["printer"]:
         fleet["fleet_longest_job"] = best_job
     if best_print["printer"]:
         fleet["fleet_longest_print"] = best_print
 
-    def _month_sort_key(label: str) -> float:
-        try:
-            return datetime.strptime(label, "%b %Y").timestamp()
-        except Exception:
-            return 0.0
-
-    fleet_periods = [{"label": k, "hours": float(v)} for k, v in fleet_by_month.items()]
-    fleet_periods.sort(key=lambda x: _month_sort_key(x["label"]))
-    fleet["by_period"] = fleet_periods
+    # "YYYY-MM" keys sort chronologically as strings
+    fleet["by_period"] = [
+        {"label": _month_label_from_key(k), "hours": float(fleet_by_month[k])}
+        for k in sorted(fleet_by_month)
+    ]
 
     if fleet_last_end_ts > 0:
         fleet["last_print_finished"] = datetime.fromtimestamp(fleet_last_end_ts).isoformat()
@@ -1653,6 +5092,86 @@ def history_aggregate():
         "by_printer": per_printer_sorted,
     })
 
+# Query bounds accepted by /api/history/query (1970-01-01 .. 2100-01-01 UTC);
+# anything outside can't be turned into local-time buckets.
+HISTORY_QUERY_MIN_TS = 0.0
+HISTORY_QUERY_MAX_TS = 4102444800.0
+
+def _parse_time_arg(raw: Optional[str], default: float) -> float:
+    """
+    Epoch seconds or an ISO date/datetime (local time).
+    Raises ValueError for anything unparseable or outside the query bounds.
+    """
+    if raw is None or not raw.strip():
+        return default
+    raw = raw.strip()
+    try:
+        ts = float(raw)
+    except ValueError:
+        try:
+            ts = datetime.fromisoformat(raw).timestamp()
+        except (OverflowError, OSError) as e:
+            raise ValueError(str(e)) from e
+    if not HISTORY_QUERY_MIN_TS <= ts <= HISTORY_QUERY_MAX_TS:  # also rejects nan
+        raise ValueError(f"time out of range: {raw}")
+    return ts
+
+@app.route("/api/history/query", methods=["GET"])
+@require_auth
+def history_query():
+    """
+    Time-range analytics over the local job store:
+      ?since=&until=        epoch seconds or ISO dates (default: the last 365 days)
+      ?granularity=         day | week | month (default month)
+      ?group_by=            printer | file (optional)
+      ?limit=               max groups returned (default 50)
+    """
+    cidr = normalize_scan_cidr(request.args.get("cidr", DEFAULT_SCAN_CIDR))
+    if cidr is None:
+        return jsonify(SCAN_CIDR_ERROR), 400
+    warm = request.args.get("warm", "0") != "0"
+    ports_arg = request.args.get("ports", "")
+    ports = [7125, 80, 4408]
+    if ports_arg.strip():
+        try:
+            ports = [int(p.strip()) for p in ports_arg.split(",") if p.strip()]
+        except ValueError:
+            return jsonify({"error": "Invalid ports param. Use e.g. ?ports=7125,80,4408"}), 400
+
+    granularity = request.args.get("granularity", "month").strip().lower()
+    if granularity not in HISTORY_QUERY_GRANULARITIES:
+        return jsonify({"error": "granularity must be one of: day, week, month"}), 400
+    group_by = request.args.get("group_by", "").strip().lower() or None
+    if group_by not in (None, "printer", "file"):
+        return jsonify({"error": "group_by must be printer or file"}), 400
+    try:
+        now = time.time()
+        until = _parse_time_arg(request.args.get("until"), now)
+        since = _parse_time_arg(request.args.get("since"), until - 365 * 86400)
+        limit = int(request.args.get("limit", "50"))
+    except ValueError:
+        return jsonify({"error": "Invalid since/until/limit"}), 400
+    if since >= until:
+        return jsonify({"error": "since must be before until"}), 400
+
+    devices = get_registered_devices(cidr=cidr, warm=warm, ports=ports)
+    devices = filter_devices_for_user(devices, current_user())
+    synced = [d for d in devices if d.get("hostname") and d.get("base_url")]
+
+    # Top up the store first (no-op for printers synced within HISTORY_SYNC_MIN_INTERVAL_S)
+    if synced:
+        with ThreadPoolExecutor(max_workers=min(len(synced), 16)) as pool:
+            list(pool.map(lambda d: sync_printer_history(d["hostname"], d["base_url"]), synced))
+
+    return jsonify(query_history(
+        [d["hostname"] for d in synced],
+        since=since,
+        until=until,
+        granularity=granularity,
+        group_by=group_by,
+        limit_groups=limit,
+    ))
+
 def pick_port(host="0.0.0.0", preferred=5000):
     for p in [preferred, 5050, 8000, 8080, 0]:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -1697,7 +5216,49 @@ def spa_fallback(path):
 def __routes():
     return jsonify(sorted([str(r) for r in app.url_map.iter_rules()]))
 
+# ---------------------------
+# ✅ Serving
+# ---------------------------
+#
+# Sessions, the printer registry, snapshot caches and the live websockets all
+# live in this process, so Helm runs as one process and scales with threads:
+# every request thread shares the same poller and caches. Waitress is used when
+# installed. Each open device stream holds one of its threads, so the pool is
+# sized as DEVICE_STREAM_LIMIT plus SERVE_REQUEST_THREADS for ordinary requests;
+# a smaller HELM_THREADS is raised to that floor so streams can never take
+# every thread.
+
+SERVE_MODE = os.environ.get("HELM_SERVER", "auto").strip().lower()  # auto | waitress | dev
+SERVE_REQUEST_THREADS = max(4, _env_number("HELM_REQUEST_THREADS", 16))
+SERVE_THREADS = max(
+    DEVICE_STREAM_LIMIT + SERVE_REQUEST_THREADS,
+    _env_number("HELM_THREADS", DEVICE_STREAM_LIMIT + SERVE_REQUEST_THREADS),
+)
+SERVE_CONNECTION_LIMIT = max(100, SERVE_THREADS * 4)
+
+def serve(host: str, port: int) -> None:
+    if SERVE_MODE != "dev" and waitress_serve is not None:
+        logger.info(
+            "Serving on %s:%d (waitress, %d threads, up to %d device streams)",
+            host, port, SERVE_THREADS, DEVICE_STREAM_LIMIT,
+        )
+        waitress_serve(
+            app,
+            host=host,
+            port=port,
+            threads=SERVE_THREADS,
+            connection_limit=SERVE_CONNECTION_LIMIT,
+            channel_request_lookahead=1,
+            ident="helm",
+        )
+        return
+    if SERVE_MODE == "waitress":
+        logger.warning("HELM_SERVER=waitress but waitress is not installed; using the development server")
+    logger.info("Serving on %s:%d (development server)", host, port)
+    app.run(host=host, port=port, debug=False, threaded=True)
+
 if __name__ == "__main__":
-    host = "0.0.0.0"
-    port = pick_port(host)
-    app.run(host=host, port=port, debug=False)
+    load_printer_registry()
+    host = os.environ.get("HELM_HOST", "0.0.0.0")
+    port = _env_number("HELM_PORT", 0) or pick_port(host)
+    serve(host, port)
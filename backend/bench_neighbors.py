@@ -0,0 +1,66 @@
+# bench_neighbors.py — compare the native neighbor layer against the old subprocess path
+#
+# Usage (from /backend):
+#   python bench_neighbors.py                       # table read only
+#   python bench_neighbors.py --cidr 192.168.1.0/24 --limit 64
+#
+# Table read : read_neighbor_table()  vs  `arp -a` (or `ip neigh` if arp is missing)
+# Warm-up    : one UDP sweep          vs  one ping subprocess per host (WARM_SWEEP_WORKERS threads)
+
+import argparse
+import ipaddress
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+
+
+def _timed(fn, repeat: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def _subprocess_table() -> None:
+    if shutil.which("arp"):
+        subprocess.check_output(["arp", "-a"], text=True, errors="ignore")
+    elif shutil.which("ip"):
+        subprocess.check_output(["ip", "neigh", "show"], text=True, errors="ignore")
+
+
+def _ping_sweep(hosts) -> None:
+    with ThreadPoolExecutor(max_workers=min(app.WARM_SWEEP_WORKERS, len(hosts))) as pool:
+        list(pool.map(app.ping_once, hosts))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cidr", default=None, help="also benchmark warm-up over this CIDR")
+    ap.add_argument("--limit", type=int, default=64, help="max hosts for the warm-up comparison")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    entries = app.read_neighbor_table()
+    native = _timed(app.read_neighbor_table, args.repeat)
+    print(f"neighbor table entries: {len(entries)}")
+    print(f"read_neighbor_table   : {native * 1000:8.2f} ms")
+    if shutil.which("arp") or shutil.which("ip"):
+        sub = _timed(_subprocess_table, args.repeat)
+        print(f"subprocess table read : {sub * 1000:8.2f} ms  ({sub / max(native, 1e-9):.0f}x)")
+    else:
+        print("subprocess table read : skipped (no arp/ip binary)")
+
+    if args.cidr:
+        hosts = [str(h) for h in ipaddress.ip_network(args.cidr, strict=False).hosts()][: args.limit]
+        udp = _timed(lambda: app.udp_neighbor_sweep(hosts, settle_s=0.0))
+        print(f"UDP warm-up ({len(hosts)} hosts)   : {udp * 1000:8.2f} ms")
+        if shutil.which("ping"):
+            ping = _timed(lambda: _ping_sweep(hosts))
+            print(f"ping warm-up ({len(hosts)} hosts)  : {ping * 1000:8.2f} ms  ({ping / max(udp, 1e-9):.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
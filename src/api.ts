@@ -8,6 +8,12 @@ type FetchOptions = RequestInit & { json?: any }
 // If you ever need a full URL, you can set VITE_API_BASE in .env
 const API_BASE = (import.meta as any)?.env?.VITE_API_BASE ?? ''
 
+export function apiUrl(path: string): string {
+  return path.startsWith('http://') || path.startsWith('https://')
+    ? path
+    : `${API_BASE}${path.startsWith('/') ? '' : '/'}${path}`
+}
+
 export async function apiFetch<T = any>(path: string, opts: FetchOptions = {}): Promise<T> {
   const headers = new Headers(opts.headers || {})
 
@@ -22,10 +28,7 @@ export async function apiFetch<T = any>(path: string, opts: FetchOptions = {}):
   }
 
   // Build URL safely
-  const url =
-    path.startsWith('http://') || path.startsWith('https://')
-      ? path
-      : `${API_BASE}${path.startsWith('/') ? '' : '/'}${path}`
+  const url = apiUrl(path)
 
   const res = await fetch(url, {
     ...opts,
@@ -162,11 +162,74 @@ function setTransientStatus(ips: string[], message: string) {
 // Printer address map: ip -> base_url (e.g. http://192.168.1.50:7125)
 export const printerBaseUrlByIp = ref<Record<string, string>>({})
 
-function resolvePrinterBase(printerRef: string): string {
-  const mapped = printerBaseUrlByIp.value[printerRef] || printerRef
-  if (mapped.startsWith('http://') || mapped.startsWith('https://')) return mapped
-  if (mapped.includes(':')) return `http://${mapped}`
-  return `http://${mapped}:7125`
+// Fleet commands go through the backend (POST /api/commands), which fans out to the
+// printers with pooled connections and checks the user's printer assignments.
+type FleetCommand = 'gcode' | 'start' | 'pause' | 'resume' | 'cancel' | 'emergency_stop' | 'firmware_restart'
+
+interface FleetCommandResult {
+  target: string
+  hostname?: string
+  ip?: string
+  ok: boolean
+  status_code?: number | null
+  error?: string | null
+  latency_ms?: number | null
+}
+
+interface FleetCommandResponse {
+  id: string
+  command: FleetCommand
+  targets: number
+  ok: number
+  failed: number
+  elapsed_ms: number
+  results: FleetCommandResult[]
+}
+
+type FleetCommandExtra = { script?: string; filename?: string }
+
+function postFleetCommand(targets: string[], command: FleetCommand, extra: FleetCommandExtra = {}) {
+  return apiFetch<FleetCommandResponse>('/api/commands', {
+    method: 'POST',
+    json: { targets, command, ...extra }
+  })
+}
+
+// Send to explicit targets; printers that fail can be retried once with a G-code script
+// (e.g. M112 when /printer/emergency_stop is refused). Returns the targets that succeeded/failed.
+export async function sendFleetCommandTo(
+  targets: string[],
+  command: FleetCommand,
+  fallbackScript?: string
+): Promise<{ ok: string[]; failed: string[] }> {
+  const failedOf = async (cmd: FleetCommand, tgts: string[], extra: FleetCommandExtra = {}) => {
+    try {
+      const res = await postFleetCommand(tgts, cmd, extra)
+      return res.results.filter((r) => !r.ok).map((r) => r.target)
+    } catch (err) {
+      console.error(`[Command] ${cmd} request failed:`, err)
+      return tgts
+    }
+  }
+
+  let failed = await failedOf(command, targets)
+  if (failed.length && fallbackScript) failed = await failedOf('gcode', failed, { script: fallbackScript })
+  return { ok: targets.filter((t) => !failed.includes(t)), failed }
+}
+
+async function sendFleetCommand(command: FleetCommand, extra: FleetCommandExtra = {}) {
+  const targets = [...selectedPrinters.value]
+  try {
+    const res = await postFleetCommand(targets, command, extra)
+    const failed = res.results.filter((r) => !r.ok)
+    if (failed.length) {
+      console.warn(`[Command] ${command} failed on ${failed.length} printer(s):`, failed.map((r) => `${r.target}: ${r.error}`))
+    }
+    return { ok: res.failed === 0, total: res.targets, success: res.ok, failed: res.failed }
+  } catch (err) {
+    console.error(`[Command] ${command} request failed:`, err)
+    return { ok: false, total: targets.length, success: 0, failed: targets.length }
+  }
 }
 
 
@@ -241,63 +304,67 @@ async function refreshFileListFromBackend(cidr?: string): Promise<string[]> {
 
 export { refreshFileListFromBackend }
 
-async function uploadGcodeToPrinter(base: string, file: File, opts?: { path?: string; autoPrint?: boolean }) {
-  const fd = new FormData()
-  fd.append('file', file, file.name)
-  fd.append('root', 'gcodes')
-  if (opts?.path) fd.append('path', opts.path)
-  fd.append('print', opts?.autoPrint ? 'true' : 'false')
-
-  const res = await fetch(`http://${base}/server/files/upload`, {
-    method: 'POST',
-    body: fd
-  })
-
-  if (!res.ok) {
-    const text = await res.text().catch(() => '')
-    throw new Error(`Upload failed (${res.status}): ${text}`)
-  }
+// Uploads go to the backend once (POST /api/uploads); it spools the file and streams
+// it to every selected printer, reporting progress per printer.
+type UploadTargetState = 'queued' | 'uploading' | 'retrying' | 'done' | 'skipped' | 'failed'
+
+interface UploadTarget {
+  hostname: string
+  ip?: string
+  target?: string
+  state: UploadTargetState
+  sent: number
+  size: number
+  attempts: number
+  error?: string | null
+}
 
-  const data = await res.json()
-  const uploadedPath = data?.item?.path as string | undefined
-  if (uploadedPath) {
-    lastUploadedFile.value = uploadedPath
-    selectedPrintFile.value = uploadedPath
-  }
-  return data
+interface UploadJob {
+  id: string
+  filename: string
+  uploaded_path: string
+  size: number
+  state: 'running' | 'done' | 'partial' | 'failed'
+  ok: number
+  skipped: number
+  failed: number
+  targets: UploadTarget[]
 }
 
-async function startPrintOnPrinter(base: string, filename: string) {
-  const targetBase = resolvePrinterBase(base)
-  const url = `${targetBase}/printer/print/start?filename=${encodeURIComponent(filename)}`
-  const res = await fetch(url, { method: 'POST' })
-  if (!res.ok) {
-    const text = await res.text().catch(() => '')
-    throw new Error(`Start print failed (${res.status}): ${text}`)
-  }
-  return res.json().catch(() => ({}))
+const UPLOAD_POLL_INTERVAL_MS = 500
+
+function reportUploadProgress(job: UploadJob) {
+  job.targets.forEach((t) => {
+    if (!t.target) return
+    const pct = t.size > 0 ? Math.floor((t.sent / t.size) * 100) : 100
+    if (t.state === 'uploading') setTransientStatus([t.target], `Uploading ${job.filename}... ${pct}%`)
+    else if (t.state === 'retrying') setTransientStatus([t.target], `Upload retrying (attempt ${t.attempts})...`)
+    else if (t.state === 'done') setTransientStatus([t.target], `Uploaded ${job.filename}`)
+    else if (t.state === 'skipped') setTransientStatus([t.target], `${job.filename} already on printer`)
+    else if (t.state === 'failed') setTransientStatus([t.target], `Upload failed: ${t.error || 'error'}`)
+  })
 }
 
-async function pausePrintOnPrinter(base: string) {
-  // Moonraker: /printer/print/pause
-  const targetBase = resolvePrinterBase(base)
-  const res = await fetch(`${targetBase}/printer/print/pause`, { method: 'POST' })
-  if (!res.ok) {
-    const text = await res.text().catch(() => '')
-    throw new Error(`Pause failed (${res.status}): ${text}`)
+async function distributeUpload(file: File, opts?: { path?: string; autoPrint?: boolean }): Promise<UploadJob> {
+  const fd = new FormData()
+  fd.append('file', file, file.name)
+  fd.append('targets', JSON.stringify(selectedPrinters.value))
+  if (opts?.path) fd.append('path', opts.path)
+  fd.append('print', opts?.autoPrint ? 'true' : 'false')
+
+  let job = await apiFetch<UploadJob>('/api/uploads', { method: 'POST', body: fd })
+  while (job.state === 'running') {
+    reportUploadProgress(job)
+    await new Promise((resolve) => setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS))
+    job = await apiFetch<UploadJob>(`/api/uploads/${encodeURIComponent(job.id)}`)
   }
-  return res.json().catch(() => ({}))
-}
+  reportUploadProgress(job)
 
-async function stopPrintOnPrinter(base: string) {
-  // Moonraker: /printer/print/cancel
-  const targetBase = resolvePrinterBase(base)
-  const res = await fetch(`${targetBase}/printer/print/cancel`, { method: 'POST' })
-  if (!res.ok) {
-    const text = await res.text().catch(() => '')
-    throw new Error(`Stop failed (${res.status}): ${text}`)
+  if (job.ok > 0) {
+    lastUploadedFile.value = job.uploaded_path
+    selectedPrintFile.value = job.uploaded_path
   }
-  return res.json().catch(() => ({}))
+  return job
 }
 
 /**
@@ -357,15 +424,7 @@ export const runCommand = async (command: CommandConfig, value?: any) => {
       moveLabel = `Move ${command.move.axis} ${dir > 0 ? '+' : ''}${dir * step}mm`
     }
     setTransientStatus([...selectedPrinters.value], moveLabel)
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => {
-        await fetch(`http://${base}/printer/gcode/script?script=${encodeURIComponent(script)}`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' }
-        })
-      })
-    )
-    return { ok: true }
+    return sendFleetCommand('gcode', { script })
   }
 
   // Upload file (returns summary for UI)
@@ -378,18 +437,17 @@ export const runCommand = async (command: CommandConfig, value?: any) => {
 
     setTransientStatus([...selectedPrinters.value], `Uploading ${file.name}...`)
 
-    const results = await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => {
-        const resp = await uploadGcodeToPrinter(base, file, {
-          path: uploadPath || undefined,
-          autoPrint
-        })
-        return { base, resp }
-      })
-    )
-
-    const total = results.length
-    const success = results.filter(r => r.status === 'fulfilled').length
+    let job: UploadJob
+    try {
+      job = await distributeUpload(file, { path: uploadPath || undefined, autoPrint })
+    } catch (err) {
+      console.error('[Upload] Failed to upload file:', err)
+      const total = selectedPrinters.value.length
+      return { ok: false, total, success: 0, failed: total }
+    }
+
+    const total = job.targets.length
+    const success = job.ok
     const failed = total - success
 
     // Refresh file list from backend
@@ -424,16 +482,7 @@ export const runCommand = async (command: CommandConfig, value?: any) => {
     }
 
     setTransientStatus([...selectedPrinters.value], `${command.label}: ${parsed}°C`)
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => {
-        const targetBase = resolvePrinterBase(base)
-        await fetch(`${targetBase}/printer/gcode/script?script=${encodeURIComponent(script)}`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' }
-        })
-      })
-    )
-    return { ok: true }
+    return sendFleetCommand('gcode', { script })
   }
 
   // Dropdown: select file
@@ -456,16 +505,7 @@ export const runCommand = async (command: CommandConfig, value?: any) => {
   if (command.type === 'button' && command.label === 'Cooldown') {
     const script = 'M104 T0 S0\nM104 T1 S0\nM104 T2 S0\nM140 S0'
     setTransientStatus([...selectedPrinters.value], 'Cooldown sent')
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => {
-        const targetBase = resolvePrinterBase(base)
-        await fetch(`${targetBase}/printer/gcode/script?script=${encodeURIComponent(script)}`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' }
-        })
-      })
-    )
-    return { ok: true }
+    return sendFleetCommand('gcode', { script })
   }
 
   // Start / Pause / Stop print
@@ -477,56 +517,31 @@ export const runCommand = async (command: CommandConfig, value?: any) => {
     }
 
     setTransientStatus([...selectedPrinters.value], 'Starting print...')
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => startPrintOnPrinter(base, filename))
-    )
-    return { ok: true }
+    return sendFleetCommand('start', { filename })
   }
 
   if (command.type === 'button' && command.label === 'Pause Print') {
     setTransientStatus([...selectedPrinters.value], 'Pausing print...')
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => pausePrintOnPrinter(base))
-    )
-    return { ok: true }
+    return sendFleetCommand('pause')
   }
 
   if (command.type === 'button' && command.label === 'Stop Print') {
     setTransientStatus([...selectedPrinters.value], 'Stopping print...')
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => stopPrintOnPrinter(base))
-    )
-    return { ok: true }
+    return sendFleetCommand('cancel')
   }
 
   // G-code terminal
   if (command.type === 'gcode-input' && typeof value === 'string' && value.trim() !== '') {
     const trimmed = value.trim()
     setTransientStatus([...selectedPrinters.value], `G-code: ${trimmed}`)
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => {
-        await fetch(`http://${base}/printer/gcode/script?script=${encodeURIComponent(trimmed)}`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' }
-        })
-      })
-    )
-    return { ok: true }
+    return sendFleetCommand('gcode', { script: trimmed })
   }
 
   // mapped gcode buttons (left for future)
   const gcode = gcodeCommandMap[command.label]
   if (gcode) {
     setTransientStatus([...selectedPrinters.value], command.label)
-    await Promise.allSettled(
-      selectedPrinters.value.map(async (base) => {
-        await fetch(`http://${base}/printer/gcode/script?script=${encodeURIComponent(gcode)}`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' }
-        })
-      })
-    )
-    return { ok: true }
+    return sendFleetCommand('gcode', { script: gcode })
   }
 
   // fallback